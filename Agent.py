@@ -1,9 +1,12 @@
-import queue
 import Board
 import Optimizations
+import OpenList
+import NogoodStore
+import Scheduler
 import copy
 import FlowFreeThreads
-from threading import Lock, Semaphore, Event,BoundedSemaphore
+from threading import Lock, Event
+import asyncio
 import signal
 
 FREE = -1
@@ -17,37 +20,22 @@ ROW = 0
 COL = 1
 NUMBER_OF_STRANDED_COLORS = 0
 EDGE = 0
+STEAL_THRESHOLD = 2 # A busy agent must hold at least this number of States in his openList to share them
+STEAL_BATCH = 64 # The maximal number of States that are shared at once
+NO_PENDING_STATE = float('inf') # The pending f value of an agent that has nothing to expand
 
-agents = {}
 print_mutex = Lock()
 
-global sem
-sem = BoundedSemaphore(value = 1)
-inter_agents_finished_states = {}
-
-
-# A global function to sum the total expanded nodes of all the agents.
-def get_total_expanded_nodes():
-    """
-    Sums the total expanded nodes of all the agents.
-    :return: The calculated sum.
-    """
-    total_expanded_nodes = 0
-    for agent_num in agents:
-        total_expanded_nodes += agents[agent_num].expanded_states
-        print("Agent " + str(agent_num) + " Expanded " + str(agents[agent_num].expanded_states) + " nodes")
-
-    return total_expanded_nodes
 
 class Agent:
     """
     A class represents a player (color) in the game. Every player has to complete a flow from his unique source square
     to his unique target square without interrupting the other agents (players/colors). The agent uses A* search in
     order to calculate his moves. For every agent we will store the following Attributes:
-    - openList: A minimum priority queue contains the States that the agent already achieved and still were not expanded.
-     It is ordered according to the f = g+ h values of the States: g value - How many moves the current agent performed
-     (not including forced moves and reaching his target moves). h value - The number of empty squares in the State's
-     board.
+    - openList: A minimum priority queue (OpenList) contains the States that the agent already achieved and still were
+     not expanded. It is ordered according to the f = g+ h values of the States: g value - How many moves the current
+     agent performed (not including forced moves and reaching his target moves). h value - The number of empty squares
+     in the State's board. Only the agent's own Thread pushes and pops it.
     - closedList: A list contains the States that have already been expanded.
     - finished & globalGoalState: Boolean variables indicate whether the current agent completed his flow and whether
       a solution to the puzzle (composed of the completed flows of all the agents) was found respectively.
@@ -59,12 +47,25 @@ class Agent:
     - waking_event: An Event instance from the "threading" module. It is responsible to notify the current agent that
       there is a State (node) to expand or that a global goal State was reached in case that the current agent's thread
       is sleeping.
+    - async_waking_event: The asyncio Event that plays the role of waking_event when the agent runs as a coroutine of
+      an event loop (None - the agent runs on a Thread).
+    - idle & searchExhausted: Boolean variables indicate whether the current agent is sleeping with nothing to expand
+      and whether all the agents became idle, i.e the puzzle is unsolvable, respectively.
+    - budgetExceeded: A Boolean variable indicates whether the search was stopped due to a time/States budget.
+    - best_state: The expanded State with the fewest empty squares (reported as a partial solution on a timeout).
+    - session: The Solver session that the agent belongs to - owns the other agents, the shared resource (bulletin
+      board) and its semaphore.
+    - initial_state_expanded: Whether the agent already expanded his initial State (his first step).
+    - helpers & stolen_states: Maps the number of a busy agent to a helper Agent of his color. When this agent has
+      nothing to expand, a busy agent hands him the most promising States of his openList (stolen_states - a list of
+      (agent number, States) that is accessed while holding sem) and he expands them on the busy agent's behalf by the
+      helper (work stealing), instead of sleeping.
     """
 
     #------------------------------------------------Constructor-------------------------------------------------------
-    def __init__(self, player_num, init_state, source_point, target_point):
+    def __init__(self, player_num, init_state, source_point, target_point, session):
 
-        self.openList = queue.PriorityQueue()
+        self.openList = OpenList.OpenList()
         self.closedList = []
         self.finished = False
         self.globalGoalState = False
@@ -76,7 +77,16 @@ class Agent:
         self.board_complete_own_path = None
         self.expanded_states = 0
         self.waking_event = Event()
+        self.async_waking_event = None
         self.statesFromOtherAgents_closedList = []
+        self.idle = False
+        self.searchExhausted = False
+        self.budgetExceeded = False
+        self.best_state = None
+        self.session = session
+        self.initial_state_expanded = False
+        self.helpers = {}
+        self.stolen_states = []
 
     # ------------------------------------------Methods for finding Goal state-----------------------------------------
 
@@ -89,6 +99,14 @@ class Agent:
         return True
 
 
+    def is_search_over(self):
+        """
+        Checks whether the search is over: a global goal State was found, the search space was exhausted or a budget
+        was exceeded.
+        """
+        return self.globalGoalState or self.searchExhausted or self.budgetExceeded
+
+
     def all_players_played(self, stat):
         for player in stat.finished:
             if (stat.finished[player] == False):
@@ -106,43 +124,201 @@ class Agent:
     # ---------------------Multiagent A* API----------------------
     ##############################################################
     # The Major - Multiagent A* method
-    def multiagent_astar(self):
+    def multiagent_astar(self, stop_event):
         """
         Performs the Multiagent A* algorithm. Runs unless a (global) solution to the puzzle has been found.
+        :param stop_event: The stop Event of the agent's Thread - the agent returns after the current iteration once it
+        is set.
         """
         # First expanding
+        self.expand_initial_state()
+
+        # Major loop- runs until the solution's finding (or until all the agents have nothing to expand)
+        while (not self.is_search_over() and not stop_event.is_set()):
+            if (not self.step()): # openList is empty - going to sleep
+                self.waking_event.wait()
+
+
+    async def multiagent_astar_async(self, quantum):
+        """
+        Performs the Multiagent A* algorithm as a coroutine of an asyncio event loop: yields to the other agents every
+        quantum iterations and awaits async_waking_event when there is nothing to expand. Runs unless a (global) solution
+        to the puzzle has been found.
+        :param quantum: The number of iterations between yields.
+        """
+        self.async_waking_event = asyncio.Event()
+        self.expand_initial_state()
+
+        iterations = 0
+        while (not self.is_search_over()):
+            if (not self.step()): # openList is empty - going to sleep until an agent wakes this coroutine up
+                self.async_waking_event.clear()
+                await self.async_waking_event.wait()
+            else:
+                iterations += 1
+                if (iterations % quantum == 0):
+                    await asyncio.sleep(0)
+
+
+    def expand_initial_state(self):
+        """
+        Expands the initial State of the agent (his first step).
+        """
+        self.initial_state_expanded = True
         self.expand(self.curr_state)
         self.expanded_states += 1
 
-        # Major loop- runs until the solution's finding
-        while (not self.globalGoalState):
-            got_state_from_dict = False
-            # trying to get a State contains other agents' completed flows
-            sem.acquire() # Avoiding mutual access to the shared resource contains completed States of the other agents.
+
+    def run_quantum(self, quantum):
+        """
+        Performs up to quantum iterations of the Multiagent A* (starting with the initial State) on the calling worker
+        Thread, when the agents are multiplexed over a pool of workers. Stops earlier when the agent has nothing to
+        expand (he is idle until he is woken up) or when the search is over.
+        :param quantum: The maximal number of iterations.
+        """
+        if (not self.initial_state_expanded):
+            self.expand_initial_state()
+        for _ in range(quantum):
+            if (self.is_search_over() or not self.step()):
+                return
+
+
+    def pending_f(self):
+        """
+        The f value of the most promising State this agent would expand next - from the shared resource, his openList
+        or his helpers. Read by the workers scheduling while the agent isn't running.
+        :return: The f value, NO_PENDING_STATE in case that there isn't a State to expand.
+        """
+        if (not self.initial_state_expanded):
+            return -NO_PENDING_STATE # Every agent expands his initial State before the others' States
+        f_values = [self.openList.peek_f(), self.session.inter_agents_finished_states[self.player_num].peek_f()]
+        f_values += [helper.openList.peek_f() for helper in list(self.helpers.values())]
+        f_values += [state.g_value + state.h_value for _, states in list(self.stolen_states) for state in states]
+        return min([f_value for f_value in f_values if f_value is not None], default=NO_PENDING_STATE)
+
+
+    def wake(self):
+        """
+        Marks that the agent has something to expand and wakes him up - his designated Thread or his coroutine if he is
+        sleeping, or a worker of the session.
+        """
+        self.idle = False
+        self.waking_event.set()
+        if (self.async_waking_event is not None):
+            self.async_waking_event.set()
+        self.session.notify_workers()
+
+
+    def step(self):
+        """
+        Performs a single iteration of the Multiagent A*: expands a State from the shared resource, from the openList or
+        from a helper, or finds that there is nothing to expand.
+        :return: False IFF the agent has nothing to expand and should sleep until he is woken up.
+        """
+        if (self.session.budget_exceeded()):
+            self.update_agents_about_budget_exceeded()
+        got_state_from_dict = False
+        going_to_sleep = False
+        exhausted = False
+        helper = None
+        # trying to get a State contains other agents' completed flows
+        with self.session.sem: # Avoiding mutual access to the shared resource contains completed States of the other agents.
             # Checks whether other agents posted State/s for this agent to complete his flow
-            if (inter_agents_finished_states[self.player_num].qsize() > EMPTY):
-                self.curr_state = inter_agents_finished_states[self.player_num].get()[STATE]
+            if (self.session.inter_agents_finished_states[self.player_num].qsize() > EMPTY):
+                self.curr_state = self.session.inter_agents_finished_states[self.player_num].get()[STATE]
                 got_state_from_dict = True
-                # DEBUG: self.curr_state.print_board()
-                # # DEBUG:
-                # print("Agent " + str(self.player_num) + " Expanded " + str(self.expanded_states) + " nodes")
-                # if (self.expanded_states > 1000):
-                #     print("Agent " + str(self.player_num) + " Expanded more than 1000 nodes")
-            sem.release()
-
-            if (got_state_from_dict): #and (not(self.curr_state in self.statesFromOtherAgents_closedList))):
-                self.statesFromOtherAgents_closedList.append(self.curr_state)
-                self.expand(self.curr_state)
-                self.expanded_states += 1
-            else: # There is no State from the shared resource for now - Expand a State(node) from the agent's openList
-                if (self.openList.qsize() > EMPTY):
-                    self.curr_state = self.openList.get()[1]
-                    #if (not(self.curr_state in self.closedList)):
-                    self.expand(self.curr_state)
-                    self.expanded_states += 1
-                else: # openList is empty - going to sleep
+                self.session.record_event(Scheduler.RECEIVE, self.player_num, None, self.curr_state)
+            elif (len(self.openList) == EMPTY):
+                # Nothing of his own to expand - continues the work of a busy agent
+                helper = self.get_helper_with_states()
+                if (helper is None):
+                    # Nothing to expand. The Event is cleared while holding sem, so a posted State can't be missed.
+                    going_to_sleep = True
+                    self.idle = True
                     self.waking_event.clear()
-                    self.waking_event.wait()
+                    exhausted = self.session.all_agents_idle()
+            elif (self.session.work_stealing and len(self.openList) >= STEAL_THRESHOLD):
+                self.share_states() # There is enough work to share with an idle agent
+
+        if (got_state_from_dict): #and (not(self.curr_state in self.statesFromOtherAgents_closedList))):
+            self.statesFromOtherAgents_closedList.append(self.curr_state)
+            self.expand(self.curr_state)
+            self.expanded_states += 1
+        elif (exhausted): # This agent was the last one to become idle - the puzzle is unsolvable
+            self.update_agents_about_exhausted_search()
+        elif (going_to_sleep): # openList is empty - going to sleep
+            return False
+        elif (helper is not None): # Expands a State of a busy agent on his behalf
+            self.expand_for_helper(helper)
+        else: # There is no State from the shared resource for now - Expand a State(node) from the agent's openList
+            self.curr_state = self.openList.pop()
+            #if (not(self.curr_state in self.closedList)):
+            self.expand(self.curr_state)
+            self.expanded_states += 1
+        return True
+
+
+    ##############################################################
+    # ----------------------Work Stealing-------------------------
+    ##############################################################
+
+    def get_helper_with_states(self):
+        """
+        Moves the States that busy agents handed to this agent to the helpers of their colors, and finds a helper that
+        still has States to expand. Must be called while holding sem.
+        :return: The helper Agent, None in case that there isn't.
+        """
+        for agent_num, states in self.stolen_states:
+            if (agent_num not in self.helpers):
+                self.helpers[agent_num] = self.session.create_helper(agent_num)
+            for state in states:
+                self.helpers[agent_num].openList.push(state)
+        self.stolen_states = []
+
+        for agent_num in self.helpers:
+            if (len(self.helpers[agent_num].openList) > EMPTY):
+                return self.helpers[agent_num]
+        return None
+
+
+    def share_states(self):
+        """
+        Hands the most promising States (up to half of them) of this agent's openList to a sleeping agent and wakes him
+        up. The openList is popped by its owner only, so the idle agents steal by this hand-off. Must be called while
+        holding sem.
+        """
+        for agent_num in self.session.agents:
+            agent = self.session.agents[agent_num]
+            if (agent is not self and agent.idle):
+                states = [self.openList.pop() for _ in range(min(len(self.openList) // 2, STEAL_BATCH))]
+                agent.stolen_states.append((self.player_num, states))
+                self.session.record_event(Scheduler.SHARE, self.player_num, agent_num, len(states))
+                agent.wake()
+                return
+
+
+    def expand_for_helper(self, helper):
+        """
+        Expands the best stolen State of the given helper. The successors stay in the helper's openList, the expanded
+        States and the best State are accounted to this agent.
+        :param helper: A helper Agent (of a busy agent's color) that holds stolen States.
+        """
+        helper.curr_state = helper.openList.pop()
+        helper.expanded_states = 0
+        helper.expand(helper.curr_state)
+        self.expanded_states += helper.expanded_states + 1
+        if (self.best_state is None or helper.best_state.h_value < self.best_state.h_value):
+            self.best_state = helper.best_state
+
+
+    def resident_states(self):
+        """
+        :return: The number of States in the openList of this agent and in the openLists of his helpers, including the
+        States that were handed to him. Called from other Threads (the budget checks) without sem, so the helpers are
+        iterated over a snapshot - get_helper_with_states may add a helper meanwhile.
+        """
+        return (len(self.openList) + sum(len(helper.openList) for helper in list(self.helpers.values())) +
+                sum(len(states) for _, states in self.stolen_states))
 
 
     def expand(self, state):
@@ -153,15 +329,26 @@ class Agent:
         :return: Exits this function and notifies the other agents in case that a global goal State is found.
         """
         self.closedList.append(state) # Marks state as visited
+        if (self.best_state is None or state.h_value < self.best_state.h_value):
+            self.best_state = state
         # In case that we reached to a global goal state
         if (state.is_agent_goal_state(self.player_num)):
             return
 
+        # An equivalent configuration was already proven dead (e.g. a board from the shared resource)
+        key = None
+        if (self.session.nogoods is not None):
+            key = NogoodStore.nogood_key(state)
+            if (key in self.session.nogoods):
+                return
+
         # General case, we are not in a global goal state. We will generate the successors of the current state.
         successors = self.find_successors(state)
         for s in successors:
             if ((s not in self.closedList) or (state.g_value + state.h_value > s.g_value + s.h_value)):
-                self.openList.put((s.g_value + s.h_value, s))
+                self.openList.push(s)
+        if (key is not None and len(successors) == EMPTY and not self.finished):
+            self.session.nogoods.add(key) # Every successor was dead - so is this State
 
         # In case that the last action was public i.e -this- agent finished his path
         if (self.finished):
@@ -175,7 +362,7 @@ class Agent:
         """
         Calculates the legal successors of the given State- A legal successor is free of: dead-end, region stranded,
         color stranded and bottleneck.
-        Uses fast-forwarding as possible.
+        Uses fast-forwarding as possible, and propagates the forced moves of all the agents after every move.
         :param state: The given State object.
         :return: A list contains legal successors of the given State
         """
@@ -186,15 +373,34 @@ class Agent:
             state.perform_move(optional_moves[0][0], optional_moves[0][1], self)
             state.dependencies = {}
             self.expanded_states += 1
-            if(self.process_state(state)):
+            if(not Optimizations.propagate_forced_moves(state) or self.process_state(state)):
                 optional_moves.remove(optional_moves[0])
             else:
                 optional_moves = state.get_possible_moves_for_player()
 
-        successors = [] #list of the possible next states
+        candidates = [] #list of the possible next states, before the checks
         for move in optional_moves:
             successor = copy.deepcopy(state)
             successor.perform_move(*move, self) # The '*' unpacks the row,col which are stored in move
+            # Forced moves of all the agents - a contradiction eliminates the successor
+            if (not Optimizations.propagate_forced_moves(successor)):
+                self.closedList.append(successor)
+                continue
+            candidates.append(successor)
+        if (len(candidates) == EMPTY):
+            return []
+
+        # checking for blocked agents and dead-ends of all the candidates at once
+        rejected = Optimizations.batch_detect_blocked_agent_and_dead_end(candidates, self.player_num)
+        # the cut squares of the given State, shared by the chokepoint checks of all the candidates
+        articulation_points = None
+        if (not all(rejected)):
+            articulation_points = Optimizations.find_flows_articulation_points(state)
+        successors = [] #list of the possible next states
+        for successor, is_rejected in zip(candidates, rejected):
+            if (is_rejected):
+                self.closedList.append(successor)
+                continue
             #----------------------------------------------- prints for DEBUG-----------------------------------------
 
             # print("A successor with optional move for player " + str(self.player_num) + " is square " + str(move[0]) + "," + str(move[1]) + "\n")
@@ -206,8 +412,8 @@ class Agent:
             # print(s.h_value)
             # print("\n")
 
-            # checking for dead-end, region stranded, color stranded and bottleneck as a result from the last move
-            if(self.process_state(successor)):
+            # checking for region stranded, color stranded and bottleneck as a result from the last move
+            if(self.process_state(successor, batch_checked=True, articulation_points=articulation_points)):
                 pass # The successor was already treated and eliminated (reducing the branching factor)
             else:
                 successors.append(successor)
@@ -215,22 +421,37 @@ class Agent:
 
 
 
-    def process_state(self, state):
+    def process_state(self, state, batch_checked=False, articulation_points=None):
         """
         Checks whether the given State contains dead-end, region stranded, color stranded or bottleneck (as a part of
-        reducing the branching factor). In case of an agent's goal State for this agent, it updates the relevant fields.
+        reducing the branching factor), or is equivalent to a configuration that was already proven dead (see
+        NogoodStore). In case of an agent's goal State for this agent, it updates the relevant fields.
         :param state: The given State
+        :param batch_checked: True in case that the blocked agents and the dead-ends were already checked (see
+        Optimizations.batch_detect_blocked_agent_and_dead_end).
+        :param articulation_points: The articulation points of the State that the given State is a successor of (see
+        Optimizations.check_for_chokepoint), None - to compute them for the given State.
         :return: True if there is a dead-end, region stranded, color stranded, bottleneck or this agent's goal State,
         False - otherwise.
         """
-        # checks for dead-end, region stranded, color stranded or bottleneck
+        # checks for dead-end, region stranded, color stranded or bottleneck - unless it was already proven dead
+        key = None
+        if (self.session.nogoods is not None):
+            key = NogoodStore.nogood_key(state)
+            if (key in self.session.nogoods):
+                self.closedList.append(state)
+                return True
         try:
-            if (Optimizations.detect_blocked_agent(state, self.player_num) or Optimizations.detect_dead_end(state) or Optimizations.check_for_stranded_color_and_region(state)
-                or Optimizations.check_for_bottleneck(state, self)):
+            if ((not batch_checked and (Optimizations.detect_blocked_agent(state, self.player_num) or Optimizations.detect_dead_end(state)))
+                or Optimizations.check_for_stranded_color_and_region(state)
+                or Optimizations.check_for_insufficient_room(state)
+                or Optimizations.check_for_chokepoint(state, articulation_points)):
                 # print_mutex.acquire()
                 # print ("\nThe following is a bottleneck state: \n")
                 # state.print_board()
                 # print_mutex.release()
+                if (key is not None):
+                    self.session.nogoods.add(key)
                 self.closedList.append(state)
                 return True
         except Exception as e:
@@ -254,28 +475,27 @@ class Agent:
         complete flow of this agent. Init. the relevant fields in the copied States for them.
         """
         not_finished = 0 # counts the agents that haven't played yet. not_finished == 0 <=> global goal state
-        sem.acquire()
-        #DEBUG prints
-        # print("\n " + " achieve LOCAL goal state for player "+ str(self.player_num) +" with board- " + "    \n")
-        # self.board_complete_own_path.print_board()
-
-        # Loop iterates over the agents who haven't played yet on the board_complete_own_path State
-        for agent_num in self.board_complete_own_path.finished:
-            if (self.board_complete_own_path.finished[agent_num] == False):
-                not_finished += 1
-                state_clone = copy.deepcopy(self.board_complete_own_path)
-                state_clone.g_value = 0  # In order that the other agents will prioritize this State
-                state_clone.dependencies = {}
-                state_clone.set_head(*self.board_complete_own_path.sources[agent_num]) # also determines the player number
-                state_clone.finished[self.player_num] = True
-
-                # updates the shared resource
-                global inter_agents_finished_states
-                inter_agents_finished_states[agent_num].put((state_clone.g_value + state_clone.h_value, state_clone))
-
-                agents[agent_num].waking_event.set() # notifies an agent that hasn't played yet on the current board
-
-        sem.release()
+        with self.session.sem:
+            #DEBUG prints
+            # print("\n " + " achieve LOCAL goal state for player "+ str(self.player_num) +" with board- " + "    \n")
+            # self.board_complete_own_path.print_board()
+
+            # Loop iterates over the agents who haven't played yet on the board_complete_own_path State
+            for agent_num in self.board_complete_own_path.finished:
+                if (self.board_complete_own_path.finished[agent_num] == False):
+                    not_finished += 1
+                    state_clone = copy.deepcopy(self.board_complete_own_path)
+                    state_clone.g_value = 0  # In order that the other agents will prioritize this State
+                    state_clone.dependencies = {}
+                    state_clone.set_head(*self.board_complete_own_path.sources[agent_num]) # also determines the player number
+                    state_clone.finished[self.player_num] = True
+
+                    # updates the shared resource (a superseded or a least promising State is dropped by the mailbox)
+                    mailbox = self.session.inter_agents_finished_states[agent_num]
+                    if (mailbox.put((state_clone.g_value + state_clone.h_value, state_clone))):
+                        self.session.record_event(Scheduler.POST, self.player_num, agent_num, state_clone)
+                        self.session.agents[agent_num].wake() # notifies an agent that hasn't played yet on the current board
+
         # checks for a global goal State
         if (not_finished == EVERYONE_FINISHED):
             self.globalGoalState = True
@@ -288,16 +508,36 @@ class Agent:
         Updates all the agents about finding the solution.
         :param goal_stat: The reached global goal State
         """
-        global agents
+        agents = self.session.agents
         for agent_num in agents:
             agents[agent_num].globalGoalState = True
             agents[agent_num].waking_event.set()
+        self.session.notify_workers()
 
-        Board.update_global_goal_mutex.acquire()
-        Board.goal_state = goal_stat
-        Board.update_global_goal_mutex.release()
+        self.session.set_goal_state(goal_stat)
 
 
         FlowFreeThreads.service_shutdown(signal.SIGTERM)
 
 
+    def update_agents_about_exhausted_search(self):
+        """
+        Updates all the agents that the search space was exhausted (no global goal State exists) and notifies the Main
+        Thread.
+        """
+        agents = self.session.agents
+        for agent_num in agents:
+            agents[agent_num].searchExhausted = True
+            agents[agent_num].waking_event.set()
+        self.session.notify_workers()
+
+        FlowFreeThreads.service_exhausted(signal.SIGTERM)
+
+
+    def update_agents_about_budget_exceeded(self):
+        """
+        Updates all the agents that a budget was exceeded and notifies the Main Thread.
+        """
+        self.session.stop_agents_on_budget()
+
+        FlowFreeThreads.service_budget_exceeded(signal.SIGTERM)
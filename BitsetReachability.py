@@ -0,0 +1,132 @@
+from functools import lru_cache
+
+import numpy as np
+
+FREE = -1
+
+
+@lru_cache(maxsize=None)
+def board_masks(size):
+    """
+    Calculates the masks that depend only on the size of the board.
+    :param size: The board contains size(length)X size(width)squares.
+    :return: The mask of the whole board and the masks of all the squares except the first/last column.
+    """
+    all_squares = (1 << (size * size)) - 1
+    first_col = 0
+    for row in range(size):
+        first_col |= 1 << (row * size)
+    last_col = first_col << (size - 1)
+    return all_squares, all_squares & ~first_col, all_squares & ~last_col
+
+
+
+class BitsetReachability:
+    """
+    A reachability engine over the free squares of a State. The squares are the bits of a Python int (square
+    (row, col) is bit row * size + col), so a flood fill advances a whole frontier by a few shifts and masks instead of
+    visiting the squares one by one. Contains the following attributes:
+        - size: The board contains size(length)X size(width)squares.
+        - free: The mask of the free squares.
+        - not_first_col & not_last_col: Masks of all the squares except the first/last column (prevent a horizontal
+          shift from wrapping around to the next/previous row).
+        - all_squares: The mask of the whole board.
+        - regions: The masks of the free regions (connected components of free squares), None - not labeled yet.
+    """
+
+    def __init__(self, state):
+        """
+        Constructor. Builds the mask of the free squares of the given State.
+        :param state: The given State.
+        """
+        self.size = state.size
+        self.all_squares, self.not_first_col, self.not_last_col = board_masks(self.size)
+        # bit row * size + col of the little-endian packed free squares is the square (row, col)
+        free_squares = np.packbits(np.asarray(state.board) == FREE, axis=None, bitorder='little')
+        self.free = int.from_bytes(free_squares.tobytes(), 'little')
+        self.regions = None
+
+    def square(self, row, col):
+        """
+        :return: The mask of the single square (row, col).
+        """
+        return 1 << (row * self.size + col)
+
+    def neighbours(self, mask):
+        """
+        :param mask: A mask of squares.
+        :return: The mask of the squares that are adjacent (up/down/left/right) to any square of the given mask.
+        """
+        return (((mask << 1) & self.not_first_col) | ((mask >> 1) & self.not_last_col) |
+                ((mask << self.size) & self.all_squares) | (mask >> self.size))
+
+    def flood(self, seeds):
+        """
+        Multi-source flood fill over the free squares.
+        :param seeds: A mask of free squares to start from.
+        :return: The mask of all the free squares that are connected to any of the seeds.
+        """
+        free, size, not_first_col, not_last_col = self.free, self.size, self.not_first_col, self.not_last_col
+        reached = frontier = seeds & free
+        while (frontier):
+            # the neighbours of the newly reached squares only, inlined since it is the innermost loop
+            frontier = (((frontier << 1) & not_first_col) | ((frontier >> 1) & not_last_col) | (frontier << size) |
+                        (frontier >> size)) & free & ~reached
+            reached |= frontier
+        return reached
+
+    def get_regions(self):
+        """
+        Connected-component labeling of the free squares, calculated once per State (on the first query).
+        :return: A list of the masks of the free regions.
+        """
+        if (self.regions is None):
+            self.regions = []
+            unlabeled = self.free
+            while (unlabeled):
+                region = self.flood(unlabeled & -unlabeled) # the lowest unlabeled square
+                self.regions.append(region)
+                unlabeled &= ~region
+        return self.regions
+
+    def regions_of(self, row, col):
+        """
+        :return: The mask of the free regions (connected components of free squares) adjacent to the square (row, col).
+        """
+        adjacent_squares = self.neighbours(self.square(row, col))
+        regions_mask = 0
+        for region in self.get_regions():
+            if (region & adjacent_squares):
+                regions_mask |= region
+        return regions_mask
+
+    def path_length(self, first, second, region):
+        """
+        Breadth-first search by whole frontiers inside a free region: the length of a shortest flow between two
+        squares through the region.
+        :param first: The (row, col) index of the first square.
+        :param second: The (row, col) index of the second square.
+        :param region: The mask of the free region.
+        :return: The number of free squares that the flow passes, None in case that it can't pass the region.
+        """
+        size, not_first_col, not_last_col = self.size, self.not_first_col, self.not_last_col
+        goal = self.neighbours(self.square(*second)) & region
+        reached = frontier = self.neighbours(self.square(*first)) & region
+        length = 1
+        while (frontier):
+            if (frontier & goal):
+                return length
+            frontier = (((frontier << 1) & not_first_col) | ((frontier >> 1) & not_last_col) | (frontier << size) |
+                        (frontier >> size)) & region & ~reached
+            reached |= frontier
+            length += 1
+        return None
+
+    def are_connected(self, first, second):
+        """
+        Checks whether a flow can be drawn between two squares through the free squares.
+        :param first: The (row, col) index of the first square.
+        :param second: The (row, col) index of the second square.
+        :return: True IFF a free region is adjacent to both squares.
+        """
+        return (self.regions_of(*first) & self.neighbours(self.square(*second))) != 0
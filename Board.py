@@ -1,13 +1,4 @@
 import numpy as np
-from threading import Lock
-
-
-
-global goal_state
-goal_state = None
-
-global update_global_goal_mutex
-update_global_goal_mutex = Lock()
 
 ROW = 0
 COL = 1
@@ -30,6 +21,8 @@ class State:
           represents the last cell of the player's flow. The player is a non-negative number which is associated with
           the correspond agent.
         - regions map and dependencies: Are required for performing Connected-component Labeling.
+        - nogood_key: The cached key of the State in the nogood store (see NogoodStore.nogood_key), None until it is
+          computed. Every move of the State resets it.
 
     """
 
@@ -61,6 +54,7 @@ class State:
         # Are calculated according to a call for the Connected-component Labeling function.
         self.regions_map = None
         self.curr_empty_tiles = 0
+        self.nogood_key = None
 
 
 
@@ -72,6 +66,7 @@ class State:
         """
         self.head = (row, col)
         self.player = self.board[row][col]
+        self.nogood_key = None
         # self.curr_empty_tiles = self.how_many_empty_tiles()
         # manhattan_dist = self.manhattan_distance_heur(row, col, self.targets[self.player][ROW],self.targets[self.player][COL])
         # self.h_value = self.curr_empty_tiles + manhattan_dist - 1
@@ -260,6 +255,52 @@ class State:
 
 
 
+    def free_neighbours(self, row, col):
+        """
+        Returns the free neighbours of the square [row][col]
+        :param row: The given row index.
+        :param col:  The given column index.
+        :return: A list contains the (row, col) indexes of the free adjacent neighbours
+        """
+        neighbours = []
+        for (n_row, n_col) in ((row + 1, col), (row - 1, col), (row, col + 1), (row, col - 1)):
+            if (0 <= n_row < self.size and 0 <= n_col < self.size and self.board[n_row][n_col] == FREE):
+                neighbours.append((n_row, n_col))
+        return neighbours
+
+
+    def flow_ends(self, color):
+        """
+        Returns the two open ends of color's flow. For the player it is his head and his target side, for every other
+        agent it is his source side and his target side (both may have been advanced by forced moves).
+        :param color: The given agent number.
+        :return: A tuple (source side end, target side end)
+        """
+        if (color == self.player):
+            return self.head, self.targets[color]
+        return self.sources[color], self.targets[color]
+
+
+    def extend_flow_end(self, row, col, color, source_side):
+        """
+        Advances one of the open ends of color's flow into the free square [row][col] (used for forced moves of all
+        the agents, not only the player).
+        :param row: The given row index.
+        :param col:  The given column index.
+        :param color: The given agent number.
+        :param source_side: True for advancing the source side end, False for the target side end.
+        """
+        self.board[row][col] = color
+        if (not source_side):
+            self.targets[color] = (row, col)
+        elif (color == self.player):
+            self.head = (row, col)
+        else:
+            self.sources[color] = (row, col)
+        self.h_value -= 1
+        self.nogood_key = None
+
+
     def edgepoints_neighbour_didnt_finish(self, row, col):
         """
         Checks for existence of a neighbour which is an edge point for an agent who didn't complete his flow yet.
@@ -312,6 +353,7 @@ class State:
         # updates the relevant fields of the current State
         self.board[row][col] = agent.player_num # updates the board
         self.head = (row, col) # updates the head of the agent's flow
+        self.nogood_key = None
 
         # checks the criteria for forced-move case
         successors = self.get_possible_moves_for_player()
@@ -421,6 +463,16 @@ class State:
         return True
 
 
+    def board_key(self):
+        """
+         A compact hashable identity of the State: its board, its player's head and its completed flows. States with
+         the same key are equivalent for the rest of the search.
+        :return: A tuple of the board bytes (a byte per square), the head and the finished agents.
+        """
+        return (np.array(self.board, dtype=np.int8).tobytes(), self.head,
+                tuple(agent_num for agent_num in self.finished if self.finished[agent_num]))
+
+
     def from_rowcol_to_position(self, row, col):
         """
          A method for converting indexes: from [row][col] format to the correspond total index
@@ -0,0 +1,262 @@
+import gc
+
+import numpy as np
+
+# The direction bits and the direction types of pyflowsolver (Zucker's reduction to SAT)
+LEFT = 1
+RIGHT = 2
+TOP = 4
+BOTTOM = 8
+
+DELTAS = [(LEFT, 0, -1),
+          (RIGHT, 0, 1),
+          (TOP, -1, 0),
+          (BOTTOM, 1, 0)]
+
+DIR_TYPES = [LEFT | RIGHT, TOP | BOTTOM, TOP | LEFT, TOP | RIGHT, BOTTOM | LEFT, BOTTOM | RIGHT]
+
+NO_VAR = 0
+
+# The order of the clause families inside a cell (the order of pyflowsolver's make_color_clauses/make_dir_clauses)
+ENDPOINT_COLOR = 0
+ENDPOINT_OTHER_COLORS = 1
+ENDPOINT_ONE_NEIGHBOR = 2
+ENDPOINT_NO_TWO_NEIGHBORS = 3
+CELL_ONE_COLOR = 0
+CELL_NO_TWO_COLORS = 1
+CELL_ONE_DIR = 0
+CELL_NO_TWO_DIRS = 1
+CELL_DIR_IMPLIES_COLORS = 2
+FAMILIES = 4
+
+##############################################################
+# --------------------The CnfBuffer class---------------------
+##############################################################
+
+class CnfBuffer:
+    """
+    A CNF formula as a flat buffer of literals. Clauses are added in families of a fixed width (2D arrays) or of
+    varying widths, each clause with a sorting key, and are ordered by the keys (stably) once they are all added.
+    Contains the following attributes:
+        - literals: The int32 literals of all the clauses, one after the other.
+        - offsets: The clause i is literals[offsets[i]:offsets[i + 1]].
+        - parts: The added families (keys, literals, widths) that weren't built into the buffer yet.
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.literals = np.zeros(0, dtype=np.int32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.parts = []
+
+    def add(self, keys, clauses):
+        """
+        Adds a family of clauses of the same width.
+        :param keys: The sorting key of every clause.
+        :param clauses: A 2D array - a clause in every row.
+        """
+        clauses = np.asarray(clauses, dtype=np.int32)
+        widths = np.full(len(clauses), clauses.shape[1] if clauses.ndim == 2 else 0, dtype=np.int64)
+        self.add_ragged(keys, clauses.reshape(-1), widths)
+
+    def add_ragged(self, keys, literals, widths):
+        """
+        Adds a family of clauses of varying widths.
+        :param keys: The sorting key of every clause.
+        :param literals: The literals of all the clauses, one after the other.
+        :param widths: The width of every clause.
+        """
+        keys = np.broadcast_to(np.asarray(keys, dtype=np.int64), (len(widths),))
+        self.parts.append((keys, np.asarray(literals, dtype=np.int32), np.asarray(widths, dtype=np.int64)))
+
+    def add_lists(self, keys, clauses):
+        """
+        Adds a family of clauses given as Python sequences of literals.
+        :param keys: The sorting key of every clause.
+        :param clauses: A list of clauses.
+        """
+        widths = [len(clause) for clause in clauses]
+        literals = [literal for clause in clauses for literal in clause]
+        self.add_ragged(keys, literals, widths)
+
+    def build(self):
+        """
+        Moves the added families into the buffer, ordered stably by the keys of their clauses.
+        """
+        if (not self.parts):
+            return
+        keys, literals, widths = (np.concatenate(arrays) for arrays in zip(*self.parts))
+        self.parts = []
+        starts = np.concatenate(([0], np.cumsum(widths)))[:-1]
+        order = np.argsort(keys, kind='stable')
+        widths = widths[order]
+        offsets = np.concatenate(([0], np.cumsum(widths)))
+        # the literal k of the ordered clause c comes from the literal k of its place before the ordering
+        gather = np.repeat(starts[order] - offsets[:-1], widths) + np.arange(offsets[-1])
+        self.literals = np.concatenate((self.literals, literals[gather]))
+        self.offsets = np.concatenate((self.offsets[:-1], offsets + self.offsets[-1]))
+
+    def to_lists(self):
+        """
+        Converts the buffer to the list of clauses (lists of ints) pycosat expects: every run of clauses of the same
+        width is reshaped into a 2D array and converted by a single tolist(). The cyclic garbage collector is paused
+        meanwhile - lists of ints can't form cycles, and its passes over the many new lists would take most of the time.
+        :return: The list of clauses.
+        """
+        self.build()
+        widths = np.diff(self.offsets)
+        runs = np.flatnonzero(np.diff(widths)) + 1
+        clauses = []
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for first, last in zip(np.concatenate(([0], runs)), np.concatenate((runs, [len(widths)]))):
+                if (first < last):
+                    run = self.literals[self.offsets[first]:self.offsets[last]]
+                    clauses.extend(run.reshape(last - first, widths[first]).tolist())
+        finally:
+            if (gc_was_enabled):
+                gc.enable()
+        return clauses
+
+    def __len__(self):
+        return len(self.offsets) - 1 + sum(len(part[2]) for part in self.parts)
+
+
+def pairs_of(satvars, present):
+    """
+    The pairwise at-most-one clauses of many sets of SAT variables at once (pyflowsolver's no_two for every row).
+    :param satvars: A 2D array - a set of variables in every row.
+    :param present: A boolean array of the same shape - which of the variables exist.
+    :return: The rows of the pairs' clauses, the clauses (an array of shape (N, 2)) and the number of clauses per row.
+    """
+    first, second = np.triu_indices(satvars.shape[1], 1)
+    pair_present = present[:, first] & present[:, second]
+    clauses = np.stack((-satvars[:, first], -satvars[:, second]), axis=-1)[pair_present]
+    counts = pair_present.sum(axis=1)
+    return np.repeat(np.arange(len(satvars)), counts), clauses
+
+
+def grid_of(puzzle):
+    """
+    :return: The cells indices (rows, cols) of the puzzle and a mask of the flow endpoints.
+    """
+    size = len(puzzle)
+    rows, cols = np.divmod(np.arange(size * size), size)
+    endpoints = np.array([char.isalnum() for row in puzzle for char in row])
+    return rows, cols, endpoints
+
+
+def make_color_clauses(puzzle, colors, at_most_one):
+    """
+    Generates the same clauses, in the same order, as pyflowsolver's make_color_clauses - the color SAT variables
+    (i * size + j) * num_colors + color + 1 of every cell encode a single color in a one-hot fashion.
+    :param puzzle: A String representation of the puzzle (a list of rows).
+    :param colors: Maps between char representation of colors to numerical representation.
+    :param at_most_one: The at-most-one encoder (pyflowsolver's AtMostOne).
+    :return: A CnfBuffer.
+    """
+    size = len(puzzle)
+    num_colors = len(colors)
+    rows, cols, endpoints = grid_of(puzzle)
+    color_vars = np.arange(size * size * num_colors, dtype=np.int32).reshape(size * size, num_colors) + 1
+    free_cells = np.flatnonzero(~endpoints)
+    pairwise = (at_most_one.encoding == 'pairwise')
+    cnf = CnfBuffer()
+
+    # one of the colors in every free cell is set
+    cnf.add(free_cells * FAMILIES + CELL_ONE_COLOR, color_vars[free_cells])
+    if (pairwise):
+        # no two of the colors in every free cell are set
+        pair_rows, clauses = pairs_of(color_vars[free_cells], np.ones((len(free_cells), num_colors), dtype=bool))
+        cnf.add(free_cells[pair_rows] * FAMILIES + CELL_NO_TWO_COLORS, clauses)
+
+    # the flow endpoints (a few cells), and the auxiliary variables are allocated in the order of the cells
+    for cell in range(size * size):
+        i, j = rows[cell], cols[cell]
+        if (endpoints[cell]):
+            endpoint_color = colors[puzzle[i][j]]
+            cnf.add(cell * FAMILIES + ENDPOINT_COLOR, [[color_vars[cell, endpoint_color]]])
+            cnf.add(cell * FAMILIES + ENDPOINT_OTHER_COLORS,
+                    -np.delete(color_vars[cell], endpoint_color).reshape(-1, 1))
+            neighbor_vars = [color_vars[(i + delta_i) * size + j + delta_j, endpoint_color]
+                             for (_, delta_i, delta_j) in DELTAS
+                             if 0 <= i + delta_i < size and 0 <= j + delta_j < size]
+            cnf.add(cell * FAMILIES + ENDPOINT_ONE_NEIGHBOR, [neighbor_vars])
+            cnf.add_lists(cell * FAMILIES + ENDPOINT_NO_TWO_NEIGHBORS, at_most_one(neighbor_vars))
+        elif (not pairwise):
+            cnf.add_lists(cell * FAMILIES + CELL_NO_TWO_COLORS, at_most_one(color_vars[cell].tolist()))
+
+    cnf.build()
+    return cnf
+
+
+def make_dir_clauses(puzzle, colors, dir_vars, at_most_one):
+    """
+    Generates the same clauses, in the same order, as pyflowsolver's make_dir_clauses - every free cell is exactly one
+    direction type, and a direction type implies matching colors with the neighbors it hits and different colors with
+    the other neighbors. The clauses of all the cells, colors, neighbors and direction types are generated at once by
+    index arithmetic.
+    :param puzzle: A String representation of the puzzle (a list of rows).
+    :param colors: Maps between char representation of colors to numerical representation.
+    :param dir_vars: Maps every free cell (i, j) to its direction types and their SAT variables.
+    :param at_most_one: The at-most-one encoder (pyflowsolver's AtMostOne).
+    :return: A CnfBuffer.
+    """
+    size = len(puzzle)
+    num_colors = len(colors)
+    cells = list(dir_vars) # the free cells in the order of the rows (as make_dir_vars created them)
+    free_cells = np.array([i * size + j for (i, j) in cells], dtype=np.int64).reshape(-1)
+    rows, cols = np.divmod(free_cells, size)
+    cnf = CnfBuffer()
+
+    # the direction variables of every free cell, in slots of DIR_TYPES
+    slot_vars = np.array([[dir_vars[cell].get(dir_type, NO_VAR) for dir_type in DIR_TYPES] for cell in cells],
+                         dtype=np.int32).reshape(-1, len(DIR_TYPES))
+    present = (slot_vars != NO_VAR)
+
+    # at least one direction is set in every cell
+    cnf.add_ragged(free_cells * FAMILIES + CELL_ONE_DIR, slot_vars[present], present.sum(axis=1))
+
+    # no two directions are set in every cell
+    if (at_most_one.encoding == 'pairwise'):
+        pair_rows, clauses = pairs_of(slot_vars, present)
+        cnf.add(free_cells[pair_rows] * FAMILIES + CELL_NO_TWO_DIRS, clauses)
+    else:
+        for index, cell in enumerate(cells):
+            cnf.add_lists(free_cells[index] * FAMILIES + CELL_NO_TWO_DIRS, at_most_one(dir_vars[cell].values()))
+
+    # every direction type implies the colors of the neighbors - an array of (cell, color, neighbor, direction type,
+    # clause, literal), which its C-order is the order of the nested loops of make_dir_clauses
+    dir_bits = np.array([dir_bit for (dir_bit, _, _) in DELTAS])
+    neighbor_rows = rows[:, None] + np.array([delta_i for (_, delta_i, _) in DELTAS])
+    neighbor_cols = cols[:, None] + np.array([delta_j for (_, _, delta_j) in DELTAS])
+    valid = (neighbor_rows >= 0) & (neighbor_rows < size) & (neighbor_cols >= 0) & (neighbor_cols < size)
+    hit = (np.array(DIR_TYPES)[None, :] & dir_bits[:, None]) != 0 # (neighbor, direction type)
+
+    color_range = np.arange(num_colors)
+    color_1 = (free_cells[:, None] * num_colors + color_range + 1)[:, :, None, None]
+    color_2 = ((neighbor_rows * size + neighbor_cols)[:, None, :] * num_colors + color_range[None, :, None] +
+               1)[:, :, :, None]
+    dir_var = slot_vars[:, None, None, :]
+    hit = hit[None, None, :, :]
+    shape = (len(free_cells), num_colors, len(DELTAS), len(DIR_TYPES))
+
+    literals = np.empty(shape + (2, 3), dtype=np.int32)
+    literals[..., 0] = -dir_var[..., None]
+    # this direction type implies the colors are equal (2 clauses), otherwise that they are not equal (a clause)
+    literals[..., 0, 1] = -color_1
+    literals[..., 0, 2] = np.where(hit, color_2, -color_2)
+    literals[..., 1, 1] = color_1
+    literals[..., 1, 2] = -color_2
+    used = np.empty(shape + (2,), dtype=bool)
+    used[..., 0] = present[:, None, None, :] & (hit | valid[:, None, :, None])
+    used[..., 1] = present[:, None, None, :] & hit
+    # an explicit row length, since -1 can't be inferred for a puzzle without free cells
+    counts = used.reshape(len(free_cells), np.prod(used.shape[1:])).sum(axis=1)
+    cnf.add(np.repeat(free_cells * FAMILIES + CELL_DIR_IMPLIES_COLORS, counts), literals[used])
+
+    cnf.build()
+    return cnf
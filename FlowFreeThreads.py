@@ -1,14 +1,11 @@
 import Agent
 import threading
+import time
 import sys
 import ctypes
 
-
-threads = {} # A container for the Threads
-colorsAndPlayers = {} # Maps between char representation of players to numerical representation
-
-global started_threads # Global counter for counting the custom Threads that are already running
-started_threads = 0
+WORKER_QUANTUM = 16 # The number of iterations a worker performs for an agent before choosing the next agent
+JOIN_TIMEOUT = 30 # The maximal number of seconds to wait for all the Threads of the Threads-pool to exit
 
 
 ##############################################################
@@ -31,34 +28,80 @@ def service_shutdown(signum):
     print('Caught signal %d' % signum)
     raise ServiceExit
 
+
+class SearchExhausted(Exception):
+    """
+    A custom Exception which is used to trigger the main program that all the agents are idle, i.e the puzzle is
+    unsolvable.
+    """
+    pass
+
+
+def service_exhausted(signum):
+    """
+    The method which throws the custom exception in order to indicate the Main Thread that the search space was
+    exhausted without finding a solution.
+    :param signum: The signal for broadcasting the Main Thread
+    :return: Raises a SearchExhausted (Exception) object
+    """
+    print('Caught signal %d - all the agents are idle' % signum)
+    raise SearchExhausted
+
+
+class BudgetExceeded(Exception):
+    """
+    A custom Exception which is used to trigger the main program that the search was stopped due to a budget.
+    """
+    pass
+
+
+def service_budget_exceeded(signum):
+    """
+    The method which throws the custom exception in order to indicate the Main Thread that the expanded States or the
+    resident States budget was exceeded.
+    :param signum: The signal for broadcasting the Main Thread
+    :return: Raises a BudgetExceeded (Exception) object
+    """
+    print('Caught signal %d - a budget was exceeded' % signum)
+    raise BudgetExceeded
+
 ############################################################################################
 # Global Functions for Starting and Terminating all the FreeFlowThreads in the Threads-pool
 ############################################################################################
 
-def terminate_threads():
+def terminate_threads(threads):
     """
     A method for a clean exit of all the custom running Threads. (Can't be done using Signals for custom Threads,
     only by this mechanism).
+    :param threads: The Threads-pool (maps the number of every agent to his Thread).
     """
-    thread_num = 0
-    global threads
-    for agent_index in Agent.agents:
-        threads[thread_num]._stop_event.set()
-        threads[thread_num]._is_stopped = True
+    for thread_num in threads:
+        threads[thread_num].stop()
         print("Terminating " + threads[thread_num].name)
-        thread_num += 1
 
-def run_threads():
+def run_threads(threads):
     """
     A method for starting all the custom Threads which are in the Threads-pool(container).
+    :param threads: The Threads-pool (maps the number of every agent to his Thread).
     """
-    thread_num = 0
-    global threads
-    global started_threads
-    for started_threads in Agent.agents:
-        threads[started_threads].start()
-        started_threads += 1
-    started_threads += 1
+    for thread_num in threads:
+        threads[thread_num].start()
+
+def join_threads(threads, timeout=JOIN_TIMEOUT):
+    """
+    Waits for all the custom Threads in the Threads-pool to exit (after terminate_threads). A Thread finishes the
+    iteration it is in the middle of before it exits.
+    :param threads: The Threads-pool (maps the number of every agent to his Thread).
+    :param timeout: The maximal number of seconds to wait for all of them (None - no limit).
+    :return: A list of the Threads that are still alive after the timeout.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for thread_num in threads:
+        thread = threads[thread_num]
+        thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if (thread.is_alive()):
+            print("Timed out waiting for " + thread.name)
+    return [threads[thread_num] for thread_num in threads if threads[thread_num].is_alive()]
 
 ##############################################################
 # ---------------Custom Thread class--------------------------
@@ -89,21 +132,22 @@ class FlowFreeThread (threading.Thread):
       Agent.print_mutex.acquire()
       print ("Starting " + self.name) # Atomic printing - without interrupting.
       Agent.print_mutex.release()
+      profiler = self.agent.session.start_profiler()
       try:
-        while not self._stop_event.is_set():
-            global colorsAndPlayers , started_threads
-            while (started_threads < len(colorsAndPlayers)): # Waits for all the other FreeFlowThreads to be created
-                pass
-            self.agent.multiagent_astar() # Parallel Distributed Multiagent A*
+        while not self._stop_event.is_set() and not self.agent.is_search_over():
+            self.agent.multiagent_astar(self._stop_event) # Parallel Distributed Multiagent A*
       except Exception:
         self.queue.put(sys.exc_info())
         print ("Exiting " + self.name)
+      finally:
+        self.agent.session.stop_profiler(profiler)
 
    def stop(self):
        """
-        Stops the current FreeFlowThread.
+        Stops the current FreeFlowThread (wakes the agent up in case that he is sleeping).
        """
        self._stop_event.set()
+       self.agent.waking_event.set()
 
    def is_stopped(self):
        """
@@ -131,3 +175,62 @@ class FlowFreeThread (threading.Thread):
        if res > 1: # checks for successfully Exception throwing
            ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, 0)
            print('Exception raise failure')
+
+
+##############################################################
+# ---------------Worker Thread class--------------------------
+##############################################################
+
+class WorkerThread (threading.Thread):
+   """
+    A worker Thread of a pool that multiplexes all the agents of a session: it repeatedly takes the most promising agent
+    that no other worker is running and performs a quantum of his Multiagent A* iterations.
+   """
+   def __init__(self, threadID, session, queue):
+      """
+      The worker Thread Constructor.
+      :param threadID: The number of the worker.
+      :param session: The Solver session whose agents are multiplexed.
+      :param queue: A container for catching the thrown Exceptions
+      """
+      threading.Thread.__init__(self)
+      self.threadID = threadID
+      self.name = " Worker " + str(threadID)
+      self.session = session
+      self._stop_event = threading.Event()
+      self.queue = queue
+
+   def run(self):
+      """
+        A method which performs the quanta of the agents that the session hands to this worker.
+      """
+      Agent.print_mutex.acquire()
+      print ("Starting " + self.name) # Atomic printing - without interrupting.
+      Agent.print_mutex.release()
+      profiler = self.session.start_profiler()
+      try:
+        while not self._stop_event.is_set():
+            agent = self.session.acquire_agent(self._stop_event)
+            if (agent is None):
+                break
+            try:
+                agent.run_quantum(WORKER_QUANTUM)
+            finally:
+                self.session.release_agent(agent)
+      except Exception:
+        self.queue.put(sys.exc_info())
+        print ("Exiting " + self.name)
+      finally:
+        self.session.stop_profiler(profiler)
+
+   def stop(self):
+       """
+        Stops the current worker Thread.
+       """
+       self._stop_event.set()
+
+   def is_stopped(self):
+       """
+        Returns whether the current worker Thread is stopped.
+       """
+       return self._stop_event.is_set()
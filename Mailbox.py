@@ -0,0 +1,109 @@
+import bisect
+import itertools
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 1000 # The default maximal number of States waiting in a mailbox
+F_VALUE = 0 # The indexes of an entry
+KEY = 2
+ENTRY = 0 # The indexes of a waiting State record
+STATE = 1
+DELIVERED_FACTOR = 4 # The delivered keys that are remembered, as a multiple of the capacity
+
+
+class Mailbox:
+    """
+    The mailbox of a single agent in the Shared-Resource (bulletin board): the States that contain complete flows of
+    other agents and are waiting for this agent. A bounded replacement of queue.PriorityQueue with the same put/get/qsize
+    interface - it isn't thread-safe by itself, it is accessed only while holding the session's sem.
+    Contains the following attributes:
+        - capacity: The maximal number of waiting States (None - unbounded). When the mailbox is full, the State with
+          the highest f value (of the waiting ones and the posted one) is evicted.
+        - entries: The waiting (f value, sequence number, key) entries, ordered by f value and by the posting order.
+        - states: Maps the key (see Board.State.board_key) of every waiting State to its entry and the State itself.
+        - delivered: The keys of the States that were already taken by the agent, from the least recently posted again
+          to the most recently posted again. Up to DELIVERED_FACTOR * capacity keys are remembered (the least recent
+          one is forgotten), so an equivalent board that arrives much later is delivered again rather than the memory
+          growing with the whole solving.
+        - evicted & superseded: Overflow counters - the States that were dropped since the mailbox was full, and the
+          States that were dropped since an equivalent board with a lower (or the same) f value was already waiting or
+          already delivered.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        Constructor.
+        :param capacity: The maximal number of waiting States (None - unbounded).
+        """
+        self.capacity = capacity
+        self.entries = []
+        self.states = {}
+        self.delivered = OrderedDict()
+        self.sequence = itertools.count()
+        self.evicted = 0
+        self.superseded = 0
+
+    def qsize(self):
+        """
+        :return: The number of waiting States.
+        """
+        return len(self.entries)
+
+    def put(self, item):
+        """
+        Posts a State to the agent.
+        :param item: A tuple of the f value and the State.
+        :return: True IFF the State is waiting in the mailbox (it wasn't dropped).
+        """
+        f_value, state = item
+        key = state.board_key()
+        if (key in self.delivered):
+            self.delivered.move_to_end(key)
+            self.superseded += 1
+            return False
+        if (key in self.states):
+            if (self.states[key][ENTRY][F_VALUE] <= f_value):
+                self.superseded += 1
+                return False
+            self.remove(key) # The waiting State is superseded by the posted one
+            self.superseded += 1
+
+        if (self.capacity is not None and len(self.entries) >= self.capacity):
+            self.evicted += 1
+            if (self.entries[-1][F_VALUE] <= f_value): # The posted State is the least promising one
+                return False
+            self.remove(self.entries[-1][KEY])
+
+        entry = (f_value, next(self.sequence), key)
+        bisect.insort(self.entries, entry)
+        self.states[key] = (entry, state)
+        return True
+
+    def get(self):
+        """
+        Takes the most promising waiting State (the lowest f value, the earliest posted among the equal ones).
+        :return: A tuple of the f value and the State.
+        """
+        f_value, _, key = self.entries.pop(0)
+        self.delivered[key] = None
+        if (self.capacity is not None and len(self.delivered) > DELIVERED_FACTOR * self.capacity):
+            self.delivered.popitem(last=False)
+        return f_value, self.states.pop(key)[STATE]
+
+    def peek_f(self):
+        """
+        The f value of the most promising waiting State. Used by the workers scheduling (see Solver.acquire_agent) as
+        a hint without holding sem, so the mailbox may change meanwhile.
+        :return: The f value, None in case that the mailbox is empty.
+        """
+        try:
+            return self.entries[0][F_VALUE]
+        except IndexError:
+            return None
+
+    def remove(self, key):
+        """
+        Drops a waiting State.
+        :param key: The key of the State.
+        """
+        entry = self.states.pop(key)[ENTRY]
+        del self.entries[bisect.bisect_left(self.entries, entry)]
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+
+FREE = -1
+DEFAULT_CAPACITY = 100000 # The default maximal number of stored configurations
+
+
+def nogood_key(state):
+    """
+    The part of a State that decides whether its search can still succeed: the mask of the free squares, the player
+    and his head, and the edge points of every agent who didn't complete his flow. The squares that are already filled
+    only block the flows, so States that differ only in the routes of the completed flows share the same key.
+    The key is computed once and cached on the State (until its next move), so the checks of a successor and its
+    expansion share it.
+    :param state: The given State.
+    :return: A hashable tuple.
+    """
+    if (state.nogood_key is None):
+        free_mask = np.packbits(np.array(state.board) == FREE).tobytes()
+        unfinished_ends = tuple((agent_num, state.sources[agent_num], state.targets[agent_num])
+                                for agent_num in state.finished if state.finished[agent_num] == False)
+        state.nogood_key = (free_mask, state.player, state.head, unfinished_ends)
+    return state.nogood_key
+
+
+class NogoodStore:
+    """
+    A bounded store of proven-dead configurations (see nogood_key), shared by all the agents of a session: the States
+    that the Optimizations rules rejected and the States whose expansion left no successor. An agent that reaches an
+    equivalent configuration (e.g. from another board on the bulletin board) rejects it by a lookup instead of
+    repeating the checks. The lookups are a plain dictionary read, without a lock, since every agent looks up each of
+    its successors; only the additions are serialized by the store's lock. Contains the following attributes:
+        - capacity: The maximal number of stored configurations. When the store is full, the least recently added one
+          is evicted (adding a stored configuration again renews it).
+        - nogoods: The stored keys, ordered from the least recently added to the most recently added.
+        - hits, added & evicted: The lookups that found a stored configuration (counted without the lock, so it may
+          miss a few concurrent hits), the stored configurations and the configurations that were dropped since the
+          store was full.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        Constructor.
+        :param capacity: The maximal number of stored configurations.
+        """
+        self.capacity = capacity
+        self.nogoods = OrderedDict()
+        self.mutex = Lock()
+        self.hits = 0
+        self.added = 0
+        self.evicted = 0
+
+    def __contains__(self, key):
+        """
+        :param key: The key (see nogood_key) of a State.
+        :return: True IFF the configuration was proven dead.
+        """
+        if (key not in self.nogoods):
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, key):
+        """
+        Stores a proven-dead configuration.
+        :param key: The key (see nogood_key) of the State.
+        """
+        with self.mutex:
+            if (key in self.nogoods):
+                self.nogoods.move_to_end(key)
+                return
+            self.nogoods[key] = None
+            self.added += 1
+            if (len(self.nogoods) > self.capacity):
+                self.nogoods.popitem(last=False)
+                self.evicted += 1
+
+    def clear(self):
+        """
+        Drops the stored configurations and the counters (before a new solving).
+        """
+        with self.mutex:
+            self.nogoods.clear()
+            self.hits = self.added = self.evicted = 0
+
+    def get_stats(self):
+        """
+        :return: A dictionary contains nogood_hits, nogood_added and nogood_evicted.
+        """
+        return dict(nogood_hits=self.hits, nogood_added=self.added, nogood_evicted=self.evicted)
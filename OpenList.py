@@ -0,0 +1,70 @@
+import heapq
+import itertools
+
+REMOVED = None # The node of a superseded entry (lazy deletion)
+F_VALUE = 0 # The indexes of an entry
+NEG_G_VALUE = 1
+KEY = 3
+NODE = 4
+
+
+class OpenList:
+    """
+    The openList of a single agent: a minimum heap of [f, -g, sequence number, key, node] entries and an index that maps
+    the key (see Board.State.board_key) of every waiting State to its entry. The States are ordered by their f value,
+    the deeper one (the higher g value) first among equal f values and then by their pushing order, so the States
+    themselves are never compared and the order is deterministic.
+    Only the owner agent's Thread uses it, so it isn't thread-safe (unlike queue.PriorityQueue, there is no lock).
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.index = {}
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        """
+        :return: The number of waiting States (superseded entries excluded).
+        """
+        return len(self.index)
+
+    def push(self, state):
+        """
+        Pushes a State. In case that an equivalent State is already waiting, only the better one is kept - the posted
+        State either is dropped or decreases the key of the waiting one (its old entry is deleted lazily).
+        :param state: The given State.
+        :return: True IFF the State was pushed.
+        """
+        f_value = state.g_value + state.h_value
+        key = state.board_key()
+        entry = self.index.get(key)
+        if (entry is not None):
+            if ((entry[F_VALUE], entry[NEG_G_VALUE]) <= (f_value, -state.g_value)):
+                return False
+            entry[NODE] = REMOVED
+
+        entry = [f_value, -state.g_value, next(self.sequence), key, state]
+        self.index[key] = entry
+        heapq.heappush(self.heap, entry)
+        return True
+
+    def peek_f(self):
+        """
+        :return: A lower bound of the f value of the most promising State (the top entry, which may be a superseded
+        one - it is never better than the entry that superseded it), None in case that the openList is empty.
+        """
+        if (len(self.index) == 0):
+            return None
+        return self.heap[0][F_VALUE]
+
+    def pop(self):
+        """
+        Pops the most promising State. Raises an IndexError in case that the openList is empty.
+        :return: The State with the lowest f value.
+        """
+        while (self.heap):
+            entry = heapq.heappop(self.heap)
+            if (entry[NODE] is not REMOVED):
+                del self.index[entry[KEY]]
+                return entry[NODE]
+        raise IndexError('pop from an empty openList')
@@ -1,5 +1,5 @@
-import copy
-import RegionsMap
+import numpy as np
+import BitsetReachability
 
 ROW = 0
 COL = 1
@@ -8,8 +8,6 @@ NO_FREE_NEIGHBOUR = 0
 SINGLE_FREE_NEIGHBOUR = 1
 NO_REGIONS = 0
 EMPTY = 0
-NUMBER_OF_STRANDED_COLORS = 0
-EDGE = 0
 
 
 
@@ -50,49 +48,73 @@ def detect_dead_end(state):
     return False
 
 
-def check_how_many_stranded_colors(state, is_bottleneck_check):
+def neighbours_count(masks):
+    """
+    Counts for every square of a batch of boolean masks its adjacent (up/down/left/right) squares that are set.
+    :param masks: A boolean array of shape (batch, size, size).
+    :return: An int8 array of the same shape.
+    """
+    padded = np.pad(masks, ((0, 0), (1, 1), (1, 1))).astype(np.int8)
+    return padded[:, :-2, 1:-1] + padded[:, 2:, 1:-1] + padded[:, 1:-1, :-2] + padded[:, 1:-1, 2:]
+
+
+def batch_detect_blocked_agent_and_dead_end(states, player_num):
+    """
+    The batched equivalent of detect_blocked_agent and detect_dead_end: stacks the boards of the given States and
+    evaluates all of them by a single set of array operations.
+    :param states: A list of States (e.g the successors of a State).
+    :param player_num: The number of the agent who performs the search.
+    :return: A boolean array - True for every State that has a blocked agent or a dead-end.
+    """
+    boards = np.array([state.board for state in states])
+    free = (boards == FREE)
+    free_neighbours = neighbours_count(free)
+
+    # The squares next to the head or to an edge point of an agent who didn't complete his flow can still be filled,
+    # and the edge points of the other agents who didn't complete their flows must have a free neighbour.
+    rescuers = np.zeros_like(free)
+    unfinished_ends = np.zeros_like(free)
+    for index, state in enumerate(states):
+        rescuers[index][state.head] = True
+        for edge_point in list(state.sources.values()) + list(state.targets.values()):
+            if (state.finished[state.board[edge_point[ROW]][edge_point[COL]]] == False):
+                rescuers[index][edge_point] = True
+        for agent_num in state.finished:
+            if (state.finished[agent_num] == False and agent_num != player_num):
+                unfinished_ends[index][state.sources[agent_num]] = True
+                unfinished_ends[index][state.targets[agent_num]] = True
+
+    dead_ends = free & (free_neighbours <= SINGLE_FREE_NEIGHBOUR) & (neighbours_count(rescuers) == EMPTY)
+    blocked_ends = unfinished_ends & (free_neighbours == NO_FREE_NEIGHBOUR)
+    return (dead_ends | blocked_ends).any(axis=(1, 2))
+
+
+def check_how_many_stranded_colors(state):
     """
     Calculates how many stranded colors there are in the given State.
     :param state: The given State
-    :param is_bottleneck_check: Indicates whether this function was called by "check_for_bottleneck" function or
-    by "check_for_stranded_color_and_region".
-    :return:The number of stranded colors in the given State.
-    """
-    state.regions_map = RegionsMap.RegionsMap(state.board, state.size, state)
-    # Connected-component Labeling
-    dependencies = state.regions_map.produce_regions_map_pass1()
-    labels_set = state.regions_map.produce_regions_map_pass2(dependencies)
+    :return:The number of stranded colors in the given State, the mask of the free regions that are adjacent to the
+    edge points of the colors that aren't stranded and the BitsetReachability of the State.
+    """
+    reachability = BitsetReachability.BitsetReachability(state)
     stranded_colors = 0
-    regions_contains_edgepoints = set()
+    regions_contains_edgepoints = 0
 
     # checks for stranded colors
     for color in state.finished:
         if (state.finished[color] == False):
-            if (is_bottleneck_check == False or (is_bottleneck_check == True and state.player != color)):
-                # understanding the origin of the flow.
-                if (state.player != color):
-                    current_row = state.sources[color][ROW]
-                    current_col = state.sources[color][COL]
-                else:
-                    current_row = state.head[ROW]
-                    current_col = state.head[COL]
-                target_row = state.targets[color][ROW]
-                target_col = state.targets[color][COL]
-                # finding the regions of the flow's target and the flow's source/head (in case of the current player).
-                current_region_lst = state.regions_map.find_regions(current_row, current_col)
-                target_region_lst = state.regions_map.find_regions(target_row, target_col)
-                # checks for a stranded color using sets intersection
-                if (
-                not state.regions_map.regions_lists_contains_mutual_area(current_region_lst, target_region_lst, color)):
-                    stranded_colors += 1
-                else:
-                    # updates the regions_contains_edgepoints set about regions of not-stranded colors.
-                    for region in current_region_lst:
-                        regions_contains_edgepoints.add(region)
-                    for region in target_region_lst:
-                        regions_contains_edgepoints.add(region)
-
-    return stranded_colors, regions_contains_edgepoints, labels_set
+            # understanding the origin of the flow (the head in case of the current player).
+            current_end, target_end = state.flow_ends(color)
+            # finding the regions of the flow's source/head and checking whether one of them reaches the target
+            current_regions = reachability.regions_of(*current_end)
+            if (not (state.is_agent_goal_state(color) or
+                     current_regions & reachability.neighbours(reachability.square(*target_end)))):
+                stranded_colors += 1
+            else:
+                # updates the regions_contains_edgepoints mask about regions of not-stranded colors.
+                regions_contains_edgepoints |= current_regions | reachability.regions_of(*target_end)
+
+    return stranded_colors, regions_contains_edgepoints, reachability
 
 
 # will check after an agent completed his flow (for each non-completed color there must be a region contains it's source as well at it's target)
@@ -103,62 +125,296 @@ def check_for_stranded_color_and_region(state):
     :return: True IFF there is a stranded color or a stranded region
     """
     # checks for stranded COLORS
-    stranded_colors, regions_contains_edgepoints, labels_set = check_how_many_stranded_colors(state, False)
+    stranded_colors, regions_contains_edgepoints, reachability = check_how_many_stranded_colors(state)
     if (stranded_colors > NO_REGIONS):
         return True
 
-    # checks for stranded REGION
-    if (len(labels_set - regions_contains_edgepoints) > EMPTY):
+    # checks for stranded REGION - free squares that no flow can reach
+    if (reachability.free & ~regions_contains_edgepoints):
         return True
 
     return False
 
 
-def check_for_bottleneck(state, agent):
+def check_for_insufficient_room(state):
     """
-    Checks for a bottleneck existence respecting a given state.
-    :param state: The given state to check.
-    :return: True IFF there is a in state
-    """
-    # Initialization
-    up_free, down_free, left_free, right_free = 1, 1, 1, 1
-    row, col = state.head[ROW], state.head[COL]
-    number_of_stranded_colors = 0
-
-    # checks the up direction
-    up_board = copy.deepcopy(state)
-    while (row - up_free >= EDGE and up_board.board[row - up_free][col] == FREE):
-        up_board.perform_move(row - up_free, col, agent)
-        up_free += 1
-    number_of_stranded_colors = check_how_many_stranded_colors(up_board, True)[NUMBER_OF_STRANDED_COLORS]
-    if (number_of_stranded_colors > up_free - 1):
-        return True
+    A lower bound rule for flows that are connected but don't have enough room: the flows that can pass only a single
+    free region need at least their shortest paths inside it (see BitsetReachability.path_length), and no square can
+    be shared by two flows. A stranded color (no region) is treated by check_for_stranded_color_and_region.
+    :param state: The given State to check.
+    :return: True IFF the shortest flows that must pass a free region are longer than the region.
+    """
+    reachability = BitsetReachability.BitsetReachability(state)
+    needed_squares = {} # Maps the mask of every free region to the squares that its flows need at least
+    for color in state.finished:
+        if (state.finished[color] == False):
+            source_end, target_end = state.flow_ends(color)
+            if (are_adjacent(source_end, target_end)):
+                continue
+            source_neighbours = reachability.neighbours(reachability.square(*source_end))
+            target_neighbours = reachability.neighbours(reachability.square(*target_end))
+            regions = [region for region in reachability.get_regions()
+                       if region & source_neighbours and region & target_neighbours]
+            if (len(regions) != SINGLE_FREE_NEIGHBOUR):
+                continue # A stranded color, or a color that may choose between regions
+            length = reachability.path_length(source_end, target_end, regions[0])
+            needed_squares[regions[0]] = needed_squares.get(regions[0], EMPTY) + length
+            if (needed_squares[regions[0]] > bin(regions[0]).count('1')):
+                return True
+    return False
 
-    # checks the down direction
-    down_board = copy.deepcopy(state)
-    while (row + down_free <= state.size - 1 and down_board.board[row + down_free][col] == FREE):
-        down_board.perform_move(row + down_free, col, agent)
-        down_free += 1
-    number_of_stranded_colors = check_how_many_stranded_colors(down_board, True)[NUMBER_OF_STRANDED_COLORS]
-    if (number_of_stranded_colors > down_free - 1):
-        return True
 
-    # checks the right direction
-    right_board = copy.deepcopy(state)
-    while (col + right_free <= state.size - 1 and right_board.board[row][col + right_free] == FREE):
-        right_board.perform_move(row, col + right_free, agent)
-        right_free += 1
-    number_of_stranded_colors = check_how_many_stranded_colors(right_board, True)[NUMBER_OF_STRANDED_COLORS]
-    if (number_of_stranded_colors > right_free - 1):
-        return True
+def flows_graph_neighbours(state, square, ends):
+    """
+    The neighbours of a square in the graph of the free squares and the open flow ends: a free square is connected to
+    its adjacent free squares and flow ends, a flow end is connected to its adjacent free squares only.
+    :param state: The given State.
+    :param square: The (row, col) index of a vertex of the graph.
+    :param ends: The open ends of the unfinished flows.
+    :return: A list of the adjacent vertices.
+    """
+    neighbours = state.free_neighbours(*square)
+    if (square not in ends):
+        neighbours += [end for end in ((square[ROW] + 1, square[COL]), (square[ROW] - 1, square[COL]),
+                                       (square[ROW], square[COL] + 1), (square[ROW], square[COL] - 1)) if end in ends]
+    return neighbours
 
-    # checks the left direction
-    left_board = copy.deepcopy(state)
-    while (col - left_free >= EDGE and left_board.board[row][col - left_free] == FREE):
-        left_board.perform_move(row, col - left_free, agent)
-        left_free += 1
-    number_of_stranded_colors = check_how_many_stranded_colors(left_board, True)[NUMBER_OF_STRANDED_COLORS]
-    if (number_of_stranded_colors > left_free - 1):
-        return True
 
+def find_articulation_points(state, ends):
+    """
+    Tarjan's linear time algorithm on the graph of the free squares and the open flow ends (see
+    flows_graph_neighbours): finds the articulation points (cut squares) and, for every one of them, the DFS subtrees
+    that are separated by its removal.
+    :param state: The given State.
+    :param ends: The open ends of the unfinished flows.
+    :return: A tuple (cuts, disc, last, component):
+        - cuts: Maps every articulation point to the roots of its separated DFS subtrees.
+        - disc & last: Map every vertex to its DFS discovery number, and to the last discovery number in its subtree -
+          a vertex v is in the subtree of s IFF disc[s] <= disc[v] <= last[s].
+        - component: Maps every vertex to the root of its connected component.
+    """
+    disc, low, last, component, cuts = {}, {}, {}, {}, {}
+    counter = 0
+    vertices = [(row, col) for row in range(state.size) for col in range(state.size)
+                if state.board[row][col] == FREE] + list(ends)
+    for root in vertices:
+        if (root in disc):
+            continue
+        disc[root] = low[root] = counter
+        component[root] = root
+        counter += 1
+        stack = [(root, None, iter(flows_graph_neighbours(state, root, ends)))]
+        while (stack):
+            square, parent, neighbours = stack[-1]
+            advanced = False
+            for neighbour in neighbours:
+                if (neighbour not in disc):
+                    disc[neighbour] = low[neighbour] = counter
+                    component[neighbour] = root
+                    counter += 1
+                    stack.append((neighbour, square, iter(flows_graph_neighbours(state, neighbour, ends))))
+                    advanced = True
+                    break
+                elif (neighbour != parent):
+                    low[square] = min(low[square], disc[neighbour])
+            if (advanced):
+                continue
+            stack.pop()
+            last[square] = counter - 1
+            if (parent is not None):
+                low[parent] = min(low[parent], low[square])
+                if (low[square] >= disc[parent]):
+                    cuts.setdefault(parent, []).append(square)
+        # The root is an articulation point only in case that it has more than a single DFS child
+        if (len(cuts.get(root, [])) == SINGLE_FREE_NEIGHBOUR):
+            del cuts[root]
+    return cuts, disc, last, component
+
+
+def open_flows(state):
+    """
+    :param state: The given State.
+    :return: A list of the (source end, target end) pairs of the unfinished flows whose ends aren't adjacent yet.
+    """
+    flows = []
+    for color in state.finished:
+        if (state.finished[color] == False):
+            source_end, target_end = state.flow_ends(color)
+            if (not are_adjacent(source_end, target_end)):
+                flows.append((source_end, target_end))
+    return flows
+
+
+def find_flows_articulation_points(state):
+    """
+    Finds the articulation points of the graph of the free squares and the open flow ends of the given State (see
+    find_articulation_points). Computed once for an expanded State, they are shared by the checks of all its
+    successors (see check_for_chokepoint).
+    :param state: The given State.
+    :return: The tuple of find_articulation_points.
+    """
+    return find_articulation_points(state, set(end for flow in open_flows(state) for end in flow))
+
+
+def check_for_chokepoint(state, articulation_points=None):
+    """
+    A general chokepoint rule on the graph of the free squares and the open flow ends: a flow whose two ends are
+    separated by an articulation point (cut vertex) must pass through it. A free cut square can be passed by a single
+    flow, and the end of another flow can't be passed at all.
+    The articulation points may be taken from the graph of the expanded State instead of the given successor: a move
+    and its forced moves only turn free squares into flow ends and remove the ends that were left behind, so the graph
+    of the successor is a subgraph of the expanded State's graph, and two ends that a cut separates there are
+    separated in the successor as well. The cuts that the move itself created are missed.
+    :param state: The given State to check.
+    :param articulation_points: The result of find_flows_articulation_points for the expanded State that the given
+    State is a successor of, None - to compute it for the given State.
+    :return: True IFF there is a cut that more flows must pass than it can take.
+    """
+    flows = open_flows(state)
+    ends = set(end for flow in flows for end in flow)
+    if (articulation_points is None):
+        articulation_points = find_articulation_points(state, ends)
+    cuts, disc, last, component = articulation_points
+    if (len(cuts) == EMPTY):
+        return False
+
+    def piece(cut, vertex):
+        # The part of the graph that contains vertex after the removal of cut
+        for child in cuts[cut]:
+            if (disc[child] <= disc[vertex] <= last[child]):
+                return child
+        return cut # The part that contains cut's DFS parent
+
+    # The cuts that are still vertices of the given State's graph
+    cuts_left = [cut for cut in cuts if cut in ends or state.board[cut[ROW]][cut[COL]] == FREE]
+    passing_flows = {} # Maps every cut to the number of flows that must pass through it
+    for source_end, target_end in flows:
+        if (source_end not in disc or target_end not in disc):
+            continue # Not an open end in the expanded State's graph (its two ends were adjacent there)
+        if (component[source_end] != component[target_end]):
+            continue # A stranded color - treated by check_for_stranded_color_and_region
+        for cut in cuts_left:
+            if (cut == source_end or cut == target_end or component[cut] != component[source_end]):
+                continue
+            if (piece(cut, source_end) != piece(cut, target_end)):
+                if (cut in ends): # The end of another flow
+                    return True
+                passing_flows[cut] = passing_flows.get(cut, 0) + 1
+                if (passing_flows[cut] > SINGLE_FREE_NEIGHBOUR):
+                    return True
     return False
+
+
+def are_adjacent(first, second):
+    """
+    Checks whether two squares are adjacent.
+    :param first: The (row, col) index of the first square.
+    :param second: The (row, col) index of the second square.
+    :return: True IFF the squares share an edge.
+    """
+    return abs(first[ROW] - second[ROW]) + abs(first[COL] - second[COL]) == SINGLE_FREE_NEIGHBOUR
+
+
+def reaches_other_end(state, reachability, square, rest_of_region, color, source_side):
+    """
+    Checks whether an end of a flow that advances into a free square with a single free neighbour can still reach the
+    other end of the flow: the other end is adjacent to the square, or to the rest of its free region (removing a
+    square with a single free neighbour keeps the region connected).
+    :param state: The given State.
+    :param reachability: The BitsetReachability of the State.
+    :param square: The (row, col) index of the free square.
+    :param rest_of_region: The mask of the square's free region, without the square.
+    :param color: The color of the flow.
+    :param source_side: True in case that the source side end is the one that advances.
+    :return: True IFF the flow can be completed through the square.
+    """
+    source_end, target_end = state.flow_ends(color)
+    other_end = target_end if source_side else source_end
+    return (are_adjacent(square, other_end) or
+            (reachability.neighbours(reachability.square(*other_end)) & rest_of_region) != EMPTY)
+
+
+def propagate_forced_moves(state):
+    """
+    Applies the forced moves of ALL the agents who didn't complete their flows, until a fixpoint is reached:
+    - An open end of a flow with a single free neighbour must advance into it.
+    - A free square with at most one free neighbour can only be filled by the flow ends adjacent to it, so in case
+      that there is a single adjacent end - it must advance into the square. With a single free neighbour, only the
+      colors that can still reach the square count: an adjacent end whose flow can't continue from the square to its
+      other end (through the rest of the square's free region, see BitsetReachability) can't take it. A free square
+      with more free neighbours isn't forced to a specific end even if a single color can reach it, so the regions
+      that no color can reach are left to check_for_stranded_color_and_region.
+    Agents (except the player, who is treated in process_state) whose two ends become adjacent are marked as finished.
+    :param state: The given State, it is updated in place.
+    :return: False IFF a contradiction (a stuck flow end or a square that can't be filled) was found, True otherwise.
+    """
+    changed = True
+    while (changed):
+        changed = False
+
+        # forced moves of the open flow ends
+        for color in state.finished:
+            if (state.finished[color] == True):
+                continue
+            source_end, target_end = state.flow_ends(color)
+            if (are_adjacent(source_end, target_end)):
+                if (color != state.player):
+                    state.finished[color] = True
+                continue
+            for source_side, end in ((True, source_end), (False, target_end)):
+                free_neighbours = state.free_neighbours(end[ROW], end[COL])
+                if (len(free_neighbours) == NO_FREE_NEIGHBOUR):
+                    return False
+                if (len(free_neighbours) == SINGLE_FREE_NEIGHBOUR):
+                    state.extend_flow_end(free_neighbours[0][ROW], free_neighbours[0][COL], color, source_side)
+                    changed = True
+                    break
+
+        if (changed):
+            continue
+
+        # free squares that only a single flow end can still reach
+        reachability = None # calculated on the first square that more than one flow end is adjacent to
+        open_ends = {}
+        for color in state.finished:
+            if (state.finished[color] == False):
+                source_end, target_end = state.flow_ends(color)
+                open_ends[source_end] = (color, True)
+                open_ends[target_end] = (color, False)
+
+        for row in range(state.size):
+            for col in range(state.size):
+                if (state.board[row][col] != FREE):
+                    continue
+                num_of_free_neighbours = state.num_of_free_neighbours(row, col)
+                if (num_of_free_neighbours > SINGLE_FREE_NEIGHBOUR):
+                    continue
+                adjacent_ends = [open_ends[neighbour] for neighbour in
+                                 ((row + 1, col), (row - 1, col), (row, col + 1), (row, col - 1))
+                                 if neighbour in open_ends]
+                if (num_of_free_neighbours == NO_FREE_NEIGHBOUR):
+                    # the square must join the two ends of a single flow
+                    adjacent_colors = [color for color, _ in adjacent_ends]
+                    if (not any(adjacent_colors.count(color) > 1 for color in adjacent_colors)):
+                        return False
+                    continue
+                if (len(adjacent_ends) > SINGLE_FREE_NEIGHBOUR):
+                    # the colors that can continue from the square to their other end
+                    if (reachability is None):
+                        reachability = BitsetReachability.BitsetReachability(state)
+                    square = reachability.square(row, col)
+                    rest_of_region = reachability.flood(square) & ~square
+                    adjacent_ends = [(color, source_side) for color, source_side in adjacent_ends
+                                     if reaches_other_end(state, reachability, (row, col), rest_of_region, color,
+                                                          source_side)]
+                if (len(adjacent_ends) == EMPTY):
+                    return False
+                elif (len(adjacent_ends) == SINGLE_FREE_NEIGHBOUR):
+                    color, source_side = adjacent_ends[0]
+                    state.extend_flow_end(row, col, color, source_side)
+                    changed = True
+                    break
+            if (changed):
+                break
+
+    return True
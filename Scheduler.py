@@ -0,0 +1,128 @@
+import json
+import random
+import hashlib
+
+STEP = 'step' # The kinds of the trace events
+POST = 'post'
+RECEIVE = 'receive'
+SHARE = 'share'
+
+
+class ReplayDivergence(Exception):
+    """
+    A custom Exception which is thrown when a replayed solving doesn't follow its trace.
+    """
+    pass
+
+
+def state_digest(state):
+    """
+    A short digest of a State (of its board, head and completed flows) for the trace events.
+    :param state: The given State.
+    :return: A hexadecimal String.
+    """
+    return hashlib.blake2b(repr(state.board_key()).encode(), digest_size=8).hexdigest()
+
+
+class DeterministicScheduler:
+    """
+    Runs the agents of a Solver session in a reproducible order: a single Thread performs one step of a single agent
+    at a time, the stepping agent is chosen by a seeded random generator among the non-idle agents. The schedule and
+    the Shared-Resource (bulletin board) traffic are recorded as a trace of events:
+        - [STEP, agent number]: The agent performed a single step of his search.
+        - [POST, agent number, addressee, State digest]: The agent posted a State with his complete flow.
+        - [RECEIVE, agent number, None, State digest]: The agent took a State from his mailbox.
+        - [SHARE, agent number, addressee, number of States]: The agent handed States to an idle agent.
+    A scheduler that was loaded from a trace file replays it - it follows the recorded schedule instead of the random
+    generator and throws a ReplayDivergence once the solving records a different event.
+    """
+
+    def __init__(self, seed=0, expected_events=None, expected_puzzle=None):
+        """
+        Constructor.
+        :param seed: The seed of the random generator.
+        :param expected_events: The events of a replayed trace (None - recording).
+        :param expected_puzzle: The puzzle of a replayed trace.
+        """
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.events = []
+        self.puzzle = None
+        self.expected_events = expected_events
+        self.expected_puzzle = expected_puzzle
+
+    @classmethod
+    def load(cls, path):
+        """
+        Creates a scheduler that replays a trace file.
+        :param path: The path of the trace file (see save).
+        :return: A DeterministicScheduler object.
+        """
+        with open(path) as infile:
+            header = json.loads(infile.readline())
+            events = [json.loads(line) for line in infile if line.strip()]
+        return cls(header['seed'], events, header['puzzle'])
+
+    def save(self, path):
+        """
+        Writes the trace of the last solving: a header line with the seed and the puzzle, then an event per line.
+        :param path: The path of the trace file.
+        """
+        with open(path, 'w') as outfile:
+            outfile.write(json.dumps(dict(seed=self.seed, puzzle=self.puzzle)) + '\n')
+            for event in self.events:
+                outfile.write(json.dumps(event) + '\n')
+
+    def reset(self, puzzle):
+        """
+        Prepares the scheduler for a new solving.
+        :param puzzle: A String representation of the puzzle (a list of rows).
+        """
+        self.random = random.Random(self.seed)
+        self.events = []
+        self.puzzle = list(puzzle)
+        if (self.expected_events is not None and self.expected_puzzle != self.puzzle):
+            raise ReplayDivergence('the trace was recorded for a different puzzle')
+
+    def choose(self, runnable_agents):
+        """
+        Chooses the agent that performs the next step.
+        :param runnable_agents: The non-idle agents, ordered by their numbers.
+        :return: The chosen Agent.
+        """
+        if (self.expected_events is None):
+            agent = self.random.choice(runnable_agents)
+        else:
+            expected = self.next_expected_event()
+            agent = None
+            for runnable_agent in runnable_agents:
+                if (expected[0] == STEP and runnable_agent.player_num == expected[1]):
+                    agent = runnable_agent
+            if (agent is None):
+                raise ReplayDivergence('event {}: expected {}, but the runnable agents are {}'.format(
+                    len(self.events), expected, [runnable_agent.player_num for runnable_agent in runnable_agents]))
+        self.events.append([STEP, int(agent.player_num)])
+        return agent
+
+    def record(self, kind, agent_num, other_num, value):
+        """
+        Records a Shared-Resource event (and checks it against the trace in case of a replay).
+        :param kind: POST, RECEIVE or SHARE.
+        :param agent_num: The number of the acting agent.
+        :param other_num: The number of the addressee (None for RECEIVE).
+        :param value: The State digest (POST and RECEIVE) or the number of States (SHARE).
+        """
+        event = [kind, int(agent_num), None if other_num is None else int(other_num), value]
+        if (self.expected_events is not None):
+            expected = self.next_expected_event()
+            if (expected != event):
+                raise ReplayDivergence('event {}: expected {}, but got {}'.format(len(self.events), expected, event))
+        self.events.append(event)
+
+    def next_expected_event(self):
+        """
+        :return: The next event of the replayed trace.
+        """
+        if (len(self.events) >= len(self.expected_events)):
+            raise ReplayDivergence('the solving outlasts the trace ({} events)'.format(len(self.expected_events)))
+        return self.expected_events[len(self.events)]
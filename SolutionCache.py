@@ -0,0 +1,150 @@
+import sqlite3
+import time
+
+FREE_CHAR = '.'
+CANONICAL_LABELS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+DEFAULT_MAX_ENTRIES = 10000
+
+# The 8 symmetries of a square board - every one maps (row, col) of an n X n board to its new (row, col).
+SYMMETRIES = [lambda row, col, n: (row, col),
+              lambda row, col, n: (col, n - 1 - row),
+              lambda row, col, n: (n - 1 - row, n - 1 - col),
+              lambda row, col, n: (n - 1 - col, row),
+              lambda row, col, n: (row, n - 1 - col),
+              lambda row, col, n: (n - 1 - row, col),
+              lambda row, col, n: (col, row),
+              lambda row, col, n: (n - 1 - col, n - 1 - row)]
+
+
+##############################################################
+# ----------------------Canonical Form------------------------
+##############################################################
+
+def transform_rows(rows, symmetry):
+    """
+    Applies a board symmetry to a board in the text format.
+    :param rows: A list of Strings, one per row.
+    :param symmetry: One of SYMMETRIES.
+    :return: The transformed list of Strings.
+    """
+    n = len(rows)
+    transformed = [[None] * n for _ in range(n)]
+    for row in range(n):
+        for col in range(n):
+            new_row, new_col = symmetry(row, col, n)
+            transformed[new_row][new_col] = rows[row][col]
+    return [''.join(row) for row in transformed]
+
+
+def relabel_colors(rows):
+    """
+    Renames the colors of a board by the order of their first appearance (row by row).
+    :param rows: A list of Strings, one per row.
+    :return: The relabeled rows and a dictionary maps every original color char to its canonical label.
+    """
+    labels = {}
+    for row in rows:
+        for char in row:
+            if (char != FREE_CHAR and char not in labels):
+                labels[char] = CANONICAL_LABELS[len(labels)]
+    relabeled = [''.join(labels.get(char, char) for char in row) for row in rows]
+    return relabeled, labels
+
+
+def canonical_form(puzzle):
+    """
+    Finds the canonical form of a puzzle under the 8 board symmetries and colors renaming: the lexicographically
+    minimal relabeled board among the transformed boards.
+    :param puzzle: A parsed puzzle (a list of Strings, one per row).
+    :return: The canonical key, the symmetry that produces it and the colors relabeling.
+    """
+    best = None
+    for symmetry in SYMMETRIES:
+        relabeled, labels = relabel_colors(transform_rows(puzzle, symmetry))
+        key = '\n'.join(relabeled)
+        if (best is None or key < best[0]):
+            best = (key, symmetry, labels)
+    return best
+
+
+##############################################################
+# ---------------------The Cache class------------------------
+##############################################################
+
+class SolutionCache:
+    """
+    A persistent (SQLite file) cache of solved puzzles, keyed by their canonical form, so rotations, reflections and
+    colors renaming of a solved puzzle are solved by a lookup. The least recently used entries are evicted when the
+    cache exceeds max_entries. The following statistics are counted:
+        - lookups & hits: The number of lookups and the number of them that found a solution.
+        - lookup_time: The accumulated time (seconds) of the lookups.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Constructor. Opens (or creates) the cache file.
+        :param path: The path of the cache file.
+        :param max_entries: The maximal number of stored solutions.
+        """
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS solutions '
+                                '(puzzle TEXT PRIMARY KEY, solution TEXT NOT NULL, last_used REAL NOT NULL)')
+        self.connection.commit()
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_time = 0.0
+
+    def lookup(self, puzzle):
+        """
+        Looks for a solution of the puzzle (or of an equivalent one).
+        :param puzzle: A parsed puzzle (a list of Strings, one per row).
+        :return: The solution in the orientation and the colors of the given puzzle (a list of Strings, one per row),
+        None in case of a miss.
+        """
+        start = time.time()
+        key, symmetry, labels = canonical_form(puzzle)
+        entry = self.connection.execute('SELECT solution FROM solutions WHERE puzzle = ?', (key,)).fetchone()
+        solution = None
+        if (entry is not None):
+            self.connection.execute('UPDATE solutions SET last_used = ? WHERE puzzle = ?', (time.time(), key))
+            self.connection.commit()
+            # Transforms the canonical solution back to the orientation and the colors of the given puzzle
+            canonical_rows = entry[0].split('\n')
+            chars = dict((label, char) for (char, label) in labels.items())
+            n = len(puzzle)
+            solution = []
+            for row in range(n):
+                solution_row = []
+                for col in range(n):
+                    canonical_row, canonical_col = symmetry(row, col, n)
+                    solution_row.append(chars[canonical_rows[canonical_row][canonical_col]])
+                solution.append(''.join(solution_row))
+            self.hits += 1
+        self.lookups += 1
+        self.lookup_time += time.time() - start
+        return solution
+
+    def store(self, puzzle, solution):
+        """
+        Stores the solution of a puzzle (in its canonical form) and evicts the least recently used entries.
+        :param puzzle: A parsed puzzle (a list of Strings, one per row).
+        :param solution: The solution of the puzzle (a list of Strings, one per row, every square contains the char of
+        its color).
+        """
+        key, symmetry, labels = canonical_form(puzzle)
+        # The colors of the solution are relabeled as the colors of the puzzle
+        canonical_rows = [''.join(labels[char] for char in row) for row in transform_rows(solution, symmetry)]
+        self.connection.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)',
+                                (key, '\n'.join(canonical_rows), time.time()))
+        self.connection.execute('DELETE FROM solutions WHERE puzzle NOT IN '
+                                '(SELECT puzzle FROM solutions ORDER BY last_used DESC LIMIT ?)', (self.max_entries,))
+        self.connection.commit()
+
+    def hit_rate(self):
+        """
+        :return: The ratio of the lookups that found a solution (0 in case that there were no lookups).
+        """
+        if (self.lookups == 0):
+            return 0.0
+        return self.hits / self.lookups
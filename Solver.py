@@ -0,0 +1,502 @@
+import copy
+import queue
+import asyncio
+import cProfile
+import pstats
+from datetime import datetime
+from threading import Lock, BoundedSemaphore, Condition
+
+import Agent
+import Board
+import FlowFreeThreads
+import Mailbox
+import NogoodStore
+import Scheduler
+
+EMPTY = 0
+ASYNC_QUANTUM = 16 # The number of iterations an agent coroutine performs before yielding to the other agents
+
+##############################################################
+# ---------------------The Result class-----------------------
+##############################################################
+
+class Result:
+    """
+    The result of a solving by the Multiagent Parallel Distributed A*. Contains the following attributes:
+        - result_char: 's' - a Global Goal-State was found, 'u' - the search space was exhausted (unsolvable puzzle) or
+          't' - a budget was exceeded (timeout).
+        - goal_state: The Global Goal-State (None in case that there isn't).
+        - best_partial_state: The expanded State with the fewest empty squares (only in case of a timeout).
+        - solving_time: The solving time in seconds.
+        - expanded_states & total_expanded: The expanded States of every agent and of all of them.
+        - mailbox_stats: The overflow counters of the mailboxes in the Shared-Resource (mailbox_evicted and
+          mailbox_superseded, summed over all the agents).
+        - nogood_stats: The counters of the nogood store (nogood_hits, nogood_added and nogood_evicted, empty in case
+          that there isn't a store).
+    """
+
+    def __init__(self, result_char, goal_state, best_partial_state, solving_time, expanded_states, mailbox_stats,
+                 nogood_stats):
+        self.result_char = result_char
+        self.goal_state = goal_state
+        self.best_partial_state = best_partial_state
+        self.solving_time = solving_time
+        self.expanded_states = expanded_states
+        self.total_expanded = sum(expanded_states.values())
+        self.mailbox_stats = mailbox_stats
+        self.nogood_stats = nogood_stats
+
+##############################################################
+# ---------------------The Solver class-----------------------
+##############################################################
+
+class Solver:
+    """
+    A solving session of the Multiagent Parallel Distributed A*. A session owns everything a solving needs, so many
+    sessions can solve concurrently in the same process and every session can solve many puzzles (one at a time).
+    Contains the following attributes:
+        - agents: Maps the number of every agent to its Agent object.
+        - inter_agents_finished_states: The Shared-Resource (bulletin board) - maps the number of every agent to a
+          bounded Mailbox of States that contain complete flows of other agents.
+        - sem: Limits the access to the Shared-Resource to a single Thread every time.
+        - threads: Maps the number of every agent to its designated FlowFreeThread.
+        - exceptions_queue: A Queue for catching the Exceptions the FlowFreeThreads throw to notify the calling Thread.
+        - goal_state & update_global_goal_mutex: The reached Global Goal-State and the mutex that protects it.
+        - max_time, max_expanded_states & max_resident_states: The budgets (None - unbounded) of the wall-clock time
+          (seconds), of the States that all the agents may expand and of the States that may be stored in the openLists
+          and in the Shared-Resource.
+        - work_stealing: Whether idle agents steal States from the openLists of busy agents.
+        - mailbox_capacity: The capacity of every agent's mailbox (None - unbounded).
+        - nogoods: The NogoodStore of the configurations that were proven dead, shared by the agents (None - the agents
+          don't store them).
+        - scheduler: A DeterministicScheduler that runs the agents in a reproducible order in the calling Thread and
+          records (or replays) their trace, None - every agent runs on his own designated Thread.
+        - workers: The number of worker Threads that the agents are multiplexed over (None - every agent runs on his own
+          designated Thread).
+        - use_asyncio: Whether the agents run as coroutines of an asyncio event loop in the calling Thread, instead of
+          on Threads (see solve_async).
+        - profile & profiles: Whether every Thread that runs agents (or the calling Thread, when it runs them) is
+          profiled, and the profilers of the finished Threads (protected by profiles_mutex).
+        - workers_condition & running: The Condition the idle workers wait on for an agent with something to expand,
+          and the numbers of the agents that workers are running now (protected by the Condition).
+        - initial_state: The State of the puzzle that is being solved (before any move).
+    """
+
+    def __init__(self, max_time=None, max_expanded_states=None, max_resident_states=None, work_stealing=True,
+                 mailbox_capacity=Mailbox.DEFAULT_CAPACITY, scheduler=None, workers=None,
+                 use_asyncio=False, nogood_capacity=None, profile=False):
+        """
+        Constructor.
+        :param max_time: The wall-clock budget (seconds) of every solving.
+        :param max_expanded_states: The budget of expanded States of every solving.
+        :param max_resident_states: The budget of resident States of every solving.
+        :param work_stealing: Whether idle agents steal States from busy agents.
+        :param mailbox_capacity: The capacity of every agent's mailbox (None - unbounded).
+        :param scheduler: A DeterministicScheduler for a deterministic solving (None - a parallel solving).
+        :param workers: The number of worker Threads for the agents (None - a designated Thread for every agent).
+        :param use_asyncio: Whether to run the agents as coroutines of an asyncio event loop.
+        :param nogood_capacity: The capacity of the nogood store (None - no nogood store).
+        :param profile: Whether to profile the agents (see get_profile_stats).
+        """
+        self.max_time = max_time
+        self.max_expanded_states = max_expanded_states
+        self.max_resident_states = max_resident_states
+        self.work_stealing = work_stealing
+        self.mailbox_capacity = mailbox_capacity
+        self.nogoods = NogoodStore.NogoodStore(nogood_capacity) if nogood_capacity else None
+        self.scheduler = scheduler
+        self.workers = workers
+        self.use_asyncio = use_asyncio
+        self.profile = profile
+        self.profiles = []
+        self.profiles_mutex = Lock()
+        self.workers_condition = Condition()
+        self.running = set()
+        self.initial_state = None
+        self.agents = {}
+        self.inter_agents_finished_states = {}
+        self.sem = BoundedSemaphore(value = 1)
+        self.threads = {}
+        self.exceptions_queue = queue.Queue()
+        self.goal_state = None
+        self.update_global_goal_mutex = Lock()
+
+    def solve(self, puzzle, colors):
+        """
+        Solves a parsed puzzle: creates an agent and a designated Thread for every color and waits (in the calling
+        Thread) until a Global Goal-State was found, the search space was exhausted or a budget was exceeded. An
+        unexpected Exception of an agent is raised (after the other agents were stopped).
+        :param puzzle: A String representation of the puzzle (a list of rows).
+        :param colors: Maps between char representation of players to numerical representation.
+        :return: A Result object.
+        """
+        self.create_agents(puzzle, colors)
+
+        if (self.scheduler is not None):
+            self.scheduler.reset(puzzle)
+            profiler = self.start_profiler()
+            try:
+                beginning_time = datetime.now()
+                budget_timeout = self.run_deterministic(beginning_time)
+                ending_time = datetime.now()
+            finally:
+                self.stop_profiler(profiler)
+        elif (self.use_asyncio):
+            profiler = self.start_profiler()
+            try:
+                beginning_time, budget_timeout, ending_time = asyncio.run(self.run_async())
+            finally:
+                self.stop_profiler(profiler)
+        else:
+            beginning_time, budget_timeout, ending_time = self.run_parallel()
+
+        return self.get_result(beginning_time, budget_timeout, ending_time)
+
+    async def solve_async(self, puzzle, colors):
+        """
+        Solves a parsed puzzle inside a running asyncio event loop (e.g. of an async service): runs the agent of every
+        color as a coroutine of the loop, without Threads.
+        :param puzzle: A String representation of the puzzle (a list of rows).
+        :param colors: Maps between char representation of players to numerical representation.
+        :return: A Result object.
+        """
+        self.create_agents(puzzle, colors)
+        beginning_time, budget_timeout, ending_time = await self.run_async()
+        return self.get_result(beginning_time, budget_timeout, ending_time)
+
+    def create_agents(self, puzzle, colors):
+        """
+        Clears the former solving and creates the initial State, the agents and their mailboxes of a parsed puzzle.
+        :param puzzle: A String representation of the puzzle (a list of rows).
+        :param colors: Maps between char representation of players to numerical representation.
+        """
+        self.reset()
+
+        # Creates a State obj. for the correspond puzzle
+        tested_state = Board.State(len(puzzle), list(puzzle), dict(colors))
+        self.initial_state = tested_state
+
+        # Generates the agents
+        for player_num in tested_state.sources:
+            self.agents[player_num] = Agent.Agent(player_num, copy.deepcopy(tested_state),
+                                                  tested_state.sources[player_num], tested_state.targets[player_num],
+                                                  self)
+
+        # Creates a mailbox for every agent in the Shared-Resource
+        for agent_num in tested_state.sources:
+            self.inter_agents_finished_states[agent_num] = Mailbox.Mailbox(self.mailbox_capacity)
+
+    def get_result(self, beginning_time, budget_timeout, ending_time):
+        """
+        Summarizes a finished solving.
+        :param beginning_time: The beginning time of the solving.
+        :param budget_timeout: Whether a budget was exceeded.
+        :param ending_time: The ending time of the solving.
+        :return: A Result object.
+        """
+        solving_time = (ending_time - beginning_time).total_seconds()
+        expanded_states = dict((agent_num, self.agents[agent_num].expanded_states) for agent_num in self.agents)
+        mailbox_stats = self.get_mailbox_stats()
+        nogood_stats = self.nogoods.get_stats() if self.nogoods is not None else {}
+        if (self.goal_state is not None):
+            return Result('s', self.goal_state, None, solving_time, expanded_states, mailbox_stats, nogood_stats)
+        # An exhausted search is a proof of unsolvability only if no State was evicted from a full mailbox
+        if (budget_timeout or mailbox_stats['mailbox_evicted'] > EMPTY):
+            return Result('t', None, self.get_best_partial_state(), solving_time, expanded_states, mailbox_stats,
+                          nogood_stats)
+        return Result('u', None, None, solving_time, expanded_states, mailbox_stats, nogood_stats)
+
+    def run_parallel(self):
+        """
+        Runs every agent on his own designated Thread (or all the agents on a pool of worker Threads) and waits for an
+        Exception to be thrown - i.e that an agent will find the Total Solution (or that all the agents became idle, or
+        that a budget was exceeded).
+        :return: The beginning time, whether a budget was exceeded and the ending time.
+        """
+        if (self.workers is not None):
+            for worker_num in range(self.workers):
+                self.threads[worker_num] = FlowFreeThreads.WorkerThread(worker_num, self, self.exceptions_queue)
+        else:
+            # Creating the designated Threads
+            for agent_num in self.agents:
+                self.threads[agent_num] = FlowFreeThreads.FlowFreeThread(agent_num, self.agents[agent_num],
+                                                                         self.exceptions_queue)
+
+        beginning_time = datetime.now()
+        FlowFreeThreads.run_threads(self.threads) # Start running the designated Threads
+
+        try:
+            exception = self.exceptions_queue.get(timeout=self.max_time)
+            budget_timeout = (exception[0] is FlowFreeThreads.BudgetExceeded)
+        except queue.Empty: # The wall-clock budget was exceeded
+            self.stop_agents_on_budget()
+            exception = None
+            budget_timeout = True
+        ending_time = datetime.now()
+
+        # Any other Exception is an error of an agent's Thread, not an outcome of the search
+        failed = (exception is not None and not issubclass(exception[0], (FlowFreeThreads.ServiceExit,
+                                                                          FlowFreeThreads.SearchExhausted,
+                                                                          FlowFreeThreads.BudgetExceeded)))
+        if (failed):
+            self.stop_agents_on_budget() # Stops the search of the other agents (wakes up the sleeping ones)
+
+        FlowFreeThreads.terminate_threads(self.threads) # Asking the running the Threads to terminate
+        self.notify_workers()
+        FlowFreeThreads.join_threads(self.threads)
+        if (failed):
+            raise exception[1].with_traceback(exception[2])
+        return beginning_time, budget_timeout, ending_time
+
+    async def run_async(self):
+        """
+        Runs every agent as a coroutine of the running asyncio event loop and waits until one of them throws an
+        Exception - i.e that an agent found the Total Solution (or that all the agents became idle, or that a budget was
+        exceeded) - or until the wall-clock budget is exceeded.
+        :return: The beginning time, whether a budget was exceeded and the ending time.
+        """
+        tasks = [asyncio.ensure_future(self.agents[agent_num].multiagent_astar_async(ASYNC_QUANTUM))
+                 for agent_num in self.agents]
+        beginning_time = datetime.now()
+        done, pending = await asyncio.wait(tasks, timeout=self.max_time, return_when=asyncio.FIRST_EXCEPTION)
+        ending_time = datetime.now()
+
+        if (not done): # The wall-clock budget was exceeded
+            self.stop_agents_on_budget()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        budget_timeout = not done
+        failure = None
+        for task in done: # Retrieves the Exceptions of all the done coroutines before raising an error of one of them
+            exception = task.exception()
+            if (isinstance(exception, FlowFreeThreads.BudgetExceeded)):
+                budget_timeout = True
+            elif (failure is None and exception is not None and
+                  not isinstance(exception, (FlowFreeThreads.ServiceExit, FlowFreeThreads.SearchExhausted))):
+                failure = exception
+        if (failure is not None):
+            raise failure
+        return beginning_time, budget_timeout, ending_time
+
+    def run_deterministic(self, beginning_time):
+        """
+        Runs all the agents in the calling Thread, a single step at a time, in the order of the scheduler - until a
+        Global Goal-State is found, the search space is exhausted or a budget is exceeded.
+        :param beginning_time: The beginning time of the solving (for the wall-clock budget).
+        :return: True IFF a budget was exceeded.
+        """
+        agents = [self.agents[agent_num] for agent_num in sorted(self.agents)]
+        try:
+            for agent in agents:
+                agent.expand_initial_state()
+            while (not agents[0].is_search_over()):
+                if (self.max_time is not None and (datetime.now() - beginning_time).total_seconds() > self.max_time):
+                    self.stop_agents_on_budget()
+                    return True
+                runnable_agents = [agent for agent in agents if not agent.idle]
+                self.scheduler.choose(runnable_agents).step()
+        except FlowFreeThreads.BudgetExceeded:
+            return True
+        except (FlowFreeThreads.ServiceExit, FlowFreeThreads.SearchExhausted):
+            return False
+        return False
+
+    def reset(self):
+        """
+        Clears the agents, the Shared-Resource, the nogood store, the Threads and the Global Goal-State of a former
+        solving. Raises a RuntimeError in case that Threads of the former solving are still running (they didn't exit
+        by FlowFreeThreads.JOIN_TIMEOUT), since they would run on the new puzzle.
+        """
+        alive_threads = [thread.name for thread in self.threads.values() if thread.is_alive()]
+        if (alive_threads):
+            raise RuntimeError("The Threads of the former solving are still running: " + ", ".join(alive_threads))
+        self.agents.clear()
+        self.inter_agents_finished_states.clear()
+        if (self.nogoods is not None):
+            self.nogoods.clear()
+        self.threads.clear()
+        self.running.clear()
+        self.sem = BoundedSemaphore(value = 1)
+        self.profiles_mutex.acquire()
+        self.profiles = []
+        self.profiles_mutex.release()
+        self.exceptions_queue = queue.Queue()
+        self.update_global_goal_mutex.acquire()
+        self.goal_state = None
+        self.update_global_goal_mutex.release()
+
+    ##############################################################
+    # --------------Services for the session's agents-------------
+    ##############################################################
+
+    def create_helper(self, player_num):
+        """
+        Creates a helper Agent of the given color - expands the States that an idle agent stole from the given agent.
+        The helper isn't one of the session's agents, so nothing is posted to him in the Shared-Resource.
+        :param player_num: The number of the robbed agent.
+        :return: The helper Agent.
+        """
+        return Agent.Agent(player_num, copy.deepcopy(self.initial_state), self.initial_state.sources[player_num],
+                           self.initial_state.targets[player_num], self)
+
+    def acquire_agent(self, stop_event):
+        """
+        Hands a worker the agent with the most promising pending State (see Agent.pending_f) among the agents that
+        aren't idle and that no other worker is running. Waits until there is one.
+        :param stop_event: The stop Event of the worker.
+        :return: The Agent, None in case that the worker was stopped or that the search is over.
+        """
+        with self.workers_condition:
+            while (True):
+                if (stop_event.is_set() or any(agent.is_search_over() for agent in self.agents.values())):
+                    return None
+                runnable_agents = [agent for agent in self.agents.values()
+                                   if not agent.idle and agent.player_num not in self.running]
+                if (runnable_agents):
+                    agent = min(runnable_agents, key=lambda agent: agent.pending_f())
+                    self.running.add(agent.player_num)
+                    return agent
+                self.workers_condition.wait()
+
+    def release_agent(self, agent):
+        """
+        Returns an agent that a worker finished running a quantum of, so any worker may run him again.
+        :param agent: The Agent.
+        """
+        with self.workers_condition:
+            self.running.discard(agent.player_num)
+            self.workers_condition.notify_all()
+
+    def notify_workers(self):
+        """
+        Wakes up the waiting workers - an agent was woken up, or the search is over.
+        """
+        with self.workers_condition:
+            self.workers_condition.notify_all()
+
+    def record_event(self, kind, agent_num, other_num, state_or_count):
+        """
+        Records a Shared-Resource event in the trace of the scheduler (nothing in case of a parallel solving).
+        :param kind: Scheduler.POST, Scheduler.RECEIVE or Scheduler.SHARE.
+        :param agent_num: The number of the acting agent.
+        :param other_num: The number of the addressee (None for RECEIVE).
+        :param state_or_count: The posted/received State, or the number of shared States.
+        """
+        if (self.scheduler is not None):
+            if (kind != Scheduler.SHARE):
+                state_or_count = Scheduler.state_digest(state_or_count)
+            self.scheduler.record(kind, agent_num, other_num, state_or_count)
+
+    def set_goal_state(self, goal_state):
+        """
+        Stores the reached Global Goal-State.
+        :param goal_state: The reached Global Goal-State
+        """
+        self.update_global_goal_mutex.acquire()
+        self.goal_state = goal_state
+        self.update_global_goal_mutex.release()
+
+    def all_agents_idle(self):
+        """
+        Checks whether the search space was exhausted: all the agents are idle (their openLists are empty) and there is
+        no State waiting for any agent in the Shared-Resource. Must be called while holding sem.
+        :return: True IFF all the agents are idle and the Shared-Resource is empty.
+        """
+        for agent_num in self.agents:
+            if (not self.agents[agent_num].idle):
+                return False
+        for agent_num in self.inter_agents_finished_states:
+            if (self.inter_agents_finished_states[agent_num].qsize() > EMPTY):
+                return False
+        return True
+
+    def budget_exceeded(self):
+        """
+        Checks whether the expanded States or the resident States (in the openLists, including the stolen States, and in
+        the Shared-Resource) of all the agents exceeded their budgets.
+        :return: True IFF one of the budgets was exceeded.
+        """
+        if (self.max_expanded_states is not None):
+            if (sum(self.agents[agent_num].expanded_states for agent_num in self.agents) > self.max_expanded_states):
+                return True
+        if (self.max_resident_states is not None):
+            resident_states = sum(self.agents[agent_num].resident_states() for agent_num in self.agents)
+            resident_states += sum(self.inter_agents_finished_states[agent_num].qsize()
+                                   for agent_num in self.inter_agents_finished_states)
+            if (resident_states > self.max_resident_states):
+                return True
+        return False
+
+    def stop_agents_on_budget(self):
+        """
+        Stops the search of all the agents since a budget was exceeded (wakes up the sleeping ones).
+        """
+        for agent_num in self.agents:
+            self.agents[agent_num].budgetExceeded = True
+            self.agents[agent_num].waking_event.set()
+        self.notify_workers()
+
+    def get_mailbox_stats(self):
+        """
+        Sums the overflow counters of all the mailboxes in the Shared-Resource.
+        :return: A dictionary contains mailbox_evicted and mailbox_superseded.
+        """
+        mailboxes = self.inter_agents_finished_states.values()
+        return dict(mailbox_evicted=sum(mailbox.evicted for mailbox in mailboxes),
+                    mailbox_superseded=sum(mailbox.superseded for mailbox in mailboxes))
+
+    def start_profiler(self):
+        """
+        Starts profiling the calling Thread (a Thread that runs agents) in case that the session is profiled.
+        :return: The running cProfile.Profile, None in case that the session isn't profiled.
+        """
+        if (not self.profile):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler):
+        """
+        Stops a profiler of start_profiler and keeps it for get_profile_stats.
+        :param profiler: The profiler (None - nothing to stop).
+        """
+        if (profiler is None):
+            return
+        profiler.disable()
+        self.profiles_mutex.acquire()
+        self.profiles.append(profiler)
+        self.profiles_mutex.release()
+
+    def get_profile_stats(self):
+        """
+        Merges the profiles of all the Threads of the last solving (a profile of a single Thread only sees the calling
+        Thread waiting for the agents). A Thread keeps its profile when it exits, and solve joins the Threads before it
+        returns, so only a Thread that didn't exit by FlowFreeThreads.JOIN_TIMEOUT is missing from the merge.
+        :return: A tuple of a pstats.Stats object (None in case that there isn't a profile) and the number of the
+        Threads whose profiles are missing since they are still running.
+        """
+        missing = len([thread for thread in self.threads.values() if thread.is_alive()])
+        self.profiles_mutex.acquire()
+        profiles = list(self.profiles)
+        self.profiles_mutex.release()
+        if (len(profiles) == EMPTY):
+            return None, missing
+        stats = pstats.Stats(profiles[0])
+        for profiler in profiles[1:]:
+            stats.add(profiler)
+        return stats, missing
+
+    def get_best_partial_state(self):
+        """
+        Finds the most advanced State (the one with the fewest empty squares) that was expanded by any of the agents.
+        :return: The found State, None in case that no State was expanded.
+        """
+        best_state = None
+        for agent_num in self.agents:
+            agent_best_state = self.agents[agent_num].best_state
+            if (agent_best_state is not None and (best_state is None or agent_best_state.h_value < best_state.h_value)):
+                best_state = agent_best_state
+        return best_state
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import json
+import threading
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_PORT = 8731
+DEFAULT_MAX_TIME = 60.0 # seconds, used when a request doesn't specify a wall-clock budget
+ENGINES = ('sat', 'astar')
+
+##############################################################
+# -------------------Warm Worker Processes--------------------
+##############################################################
+
+def init_worker(cache, max_cached):
+    """
+    Initializes a worker process of the pool: imports the solver (numpy, pycosat and the agents machinery) once, and
+    silences the prints of the solver since the results are returned as JSON.
+    :param cache: The path of the solution cache file (None - no caching).
+    :param max_cached: The maximal number of cached solutions.
+    """
+    global pyflowsolver, cache_path, cache_size
+    sys.stdout = open(os.devnull, 'w')
+    import pyflowsolver
+    cache_path = cache
+    cache_size = max_cached
+
+
+def solve_request(request):
+    """
+    Solves a single request in a worker process.
+    :param request: A dictionary contains the puzzle (in the text format), the engine and optional budgets.
+    :return: A JSON-serializable dictionary contains the status, the solution rows and the stats.
+    """
+    options = argparse.Namespace(quiet=True, display_cycles=False, display_color=False,
+                                 max_time=request.get('max_time', DEFAULT_MAX_TIME),
+                                 max_expanded=request.get('max_expanded'),
+                                 max_props=request.get('max_props'),
+                                 max_states=request.get('max_states'),
+                                 amo=request.get('amo', 'pairwise'),
+                                 redundant=request.get('redundant'),
+                                 portfolio=request.get('portfolio'),
+                                 no_steal=False, seed=None, trace=None, replay=None, profile=None,
+                                 mailbox_size=request.get('mailbox_size', pyflowsolver.DEFAULT_MAILBOX_SIZE),
+                                 workers=request.get('workers'),
+                                 nogoods=request.get('nogoods', pyflowsolver.DEFAULT_NOGOOD_SIZE),
+                                 use_asyncio=request.get('asyncio', False),
+                                 cache=cache_path, cache_size=cache_size)
+
+    puzzle, colors = pyflowsolver.parse_puzzle(options, request['puzzle'], 'request')
+    if colors is None:
+        return dict(status='invalid', error='the puzzle could not be parsed')
+
+    if (request['engine'] == 'sat'):
+        result_char, solution, stats = pyflowsolver.solve_puzzle_sat(options, puzzle, colors)
+    else:
+        result = pyflowsolver.multiagent_astar_main(options, puzzle, colors)
+        result_char = result['result_char']
+        solution = result['solution']
+        stats = dict(solving_time=result['solving_time'],
+                     total_expanded=result['total_expanded'],
+                     expanded_states=dict((str(agent_num), count) for (agent_num, count)
+                                          in result['expanded_states'].items()))
+        stats.update(result['cache_stats'])
+        stats.update(result['mailbox_stats'])
+        stats.update(result['nogood_stats'])
+        if result['best_partial_state'] is not None:
+            stats['best_partial_board'] = [[int(cell) for cell in row] for row in result['best_partial_state'].board]
+
+    return dict(status=pyflowsolver.RESULT_STRINGS[result_char],
+                engine=request['engine'],
+                solution=solution,
+                stats=stats)
+
+##############################################################
+# ------------------------HTTP Server-------------------------
+##############################################################
+
+class SolverRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles POST /solve requests. The body is a JSON object:
+        {"puzzle": "<rows of the puzzle text format>", "engine": "sat" | "astar",
+         "max_time": seconds, "max_expanded": N, "max_props": N, "max_states": N, "mailbox_size": N, "nogoods": N, "workers": M, "asyncio": true,
+         "amo": "pairwise" | "sequential" | "commander" | "bimander",
+         "redundant": ["uturn" | "corner" | "endpoint" | "link", ...], "portfolio": N}
+    Only the puzzle is mandatory. The response is a JSON object with the status, the solution rows and the stats.
+    """
+
+    def do_POST(self):
+        if (self.path != '/solve'):
+            self.send_json(404, dict(error='unknown path'))
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            if (not isinstance(request, dict)):
+                raise ValueError('expected a JSON object')
+            request.setdefault('engine', 'sat')
+            if (request['engine'] not in ENGINES or not isinstance(request.get('puzzle'), str)):
+                raise ValueError('expected a puzzle string and an engine in ' + str(ENGINES))
+        except (ValueError, KeyError) as e:
+            self.send_json(400, dict(error=str(e)))
+            return
+
+        # Bounds the concurrency - requests beyond the pool and its backlog are rejected instead of piling up
+        if (not self.server.slots.acquire(blocking=False)):
+            self.send_json(503, dict(error='the solver is busy'))
+            return
+        try:
+            result = self.server.pool.submit(solve_request, request).result()
+        except Exception as e:
+            self.send_json(500, dict(error=repr(e)))
+            return
+        finally:
+            self.server.slots.release()
+
+        self.send_json(200, result)
+
+    def send_json(self, code, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if (not self.server.quiet):
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def serve(host, port, workers, backlog, quiet, cache, cache_size):
+    """
+    Runs the daemon: a pool of warm worker processes behind a localhost HTTP server.
+    :param host: The address to listen on.
+    :param port: The port to listen on.
+    :param workers: The number of worker processes (the number of puzzles solved concurrently).
+    :param backlog: The number of requests that may wait for a free worker.
+    :param quiet: Whether to suppress the request log.
+    :param cache: The path of the solution cache file shared by the workers (None - no caching).
+    :param cache_size: The maximal number of cached solutions.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cache, cache_size))
+    # Starts all the workers now, so the first requests won't pay the imports
+    for future in [pool.submit(int, 0) for _ in range(workers)]:
+        future.result()
+
+    server = ThreadingHTTPServer((host, port), SolverRequestHandler)
+    server.pool = pool
+    server.slots = threading.BoundedSemaphore(workers + backlog)
+    server.quiet = quiet
+    print('listening on http://{}:{}/solve with {} workers'.format(host, port, workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown(cancel_futures=True)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Solve Flow Free puzzles in a long-running local daemon')
+
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+
+    parser.add_argument('-w', dest='workers', type=int, default=os.cpu_count() or 1,
+                        help='number of warm worker processes')
+
+    parser.add_argument('-b', dest='backlog', type=int, default=16,
+                        help='number of requests waiting for a worker before rejecting')
+
+    parser.add_argument('-q', dest='quiet', default=False, action='store_true',
+                        help='quiet mode (no request log)')
+
+    parser.add_argument('--cache', dest='cache', default=None, metavar='PATH',
+                        help='file of a persistent solution cache')
+
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=10000, metavar='N',
+                        help='maximal number of cached solutions')
+
+    options = parser.parse_args()
+
+    serve(options.host, options.port, options.workers, options.backlog, options.quiet, options.cache,
+          options.cache_size)
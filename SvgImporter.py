@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import bisect
+import argparse
+import xml.etree.ElementTree as ElementTree
+from multiprocessing import Pool
+
+SVG_NAMESPACE = '{http://www.w3.org/2000/svg}'
+FREE_CHAR = '.'
+
+# Maps the fill colors of the endpoints (circles) to the color chars of the puzzles text format (see ANSI_LOOKUP)
+SVG_COLORS = {'#ff0000': 'R', '#0000ff': 'B', '#eeee00': 'Y', '#008100': 'G',
+              '#ff8000': 'O', '#00ffff': 'C', '#ff00ff': 'M', '#a52a2a': 'm',
+              '#800080': 'P', '#a6a6a6': 'A', '#ffffff': 'W', '#00ff00': 'g',
+              '#bdb76b': 'T', '#00008b': 'b', '#008180': 'c', '#ff1493': 'p'}
+COLOR_CHARS = 'RBYGOCMmPAWgTbcp'
+
+
+def fill_color(element):
+    """
+    Extracts the fill color of an SVG element (from its style or its fill attribute).
+    :param element: The given element.
+    :return: The color in lower case (e.g '#ff0000'), None in case that there is no fill color.
+    """
+    for declaration in element.get('style', '').split(';'):
+        if (':' in declaration):
+            name, value = declaration.split(':', 1)
+            if (name.strip() == 'fill'):
+                return value.strip().lower()
+    fill = element.get('fill')
+    return fill.lower() if fill else None
+
+
+def svg_to_puzzle(file_or_path):
+    """
+    Converts an SVG rendering of a puzzle (a rect per square and a colored circle per endpoint) to the puzzles text
+    format. The grid size is inferred from the rects geometry and the colors are mapped by SVG_COLORS (unknown colors
+    get the unused color chars by their order of appearance).
+    :param file_or_path: A path or a file object of the SVG.
+    :return: The puzzle as a list of Strings, one per row.
+    """
+    xs, ys, circles = set(), set(), []
+    # Streaming parse - the elements are dropped as soon as they were read
+    for _, element in ElementTree.iterparse(file_or_path):
+        tag = element.tag.replace(SVG_NAMESPACE, '')
+        if (tag == 'rect' and element.get('x') is not None):
+            xs.add(float(element.get('x')))
+            ys.add(float(element.get('y')))
+        elif (tag == 'circle'):
+            circles.append((float(element.get('cx')), float(element.get('cy')), fill_color(element)))
+        element.clear()
+
+    xs, ys = sorted(xs), sorted(ys)
+    size = len(xs)
+    if (size == 0 or len(ys) != size):
+        raise ValueError('the rects are not a square grid ({}x{})'.format(len(ys), size))
+
+    rows = [[FREE_CHAR] * size for _ in range(size)]
+    chars = dict(SVG_COLORS)
+    unused_chars = [char for char in COLOR_CHARS if char not in chars.values()]
+    for cx, cy, color in circles:
+        if (color not in chars):
+            if (not unused_chars):
+                raise ValueError('too many colors, no char is left for {}'.format(color))
+            chars[color] = unused_chars.pop(0)
+        # The square of the circle is the last rect that starts before its center
+        row = bisect.bisect_right(ys, cy) - 1
+        col = bisect.bisect_right(xs, cx) - 1
+        rows[row][col] = chars[color]
+
+    return [''.join(row) for row in rows]
+
+
+def convert_file(paths):
+    """
+    Converts a single SVG file to a text puzzle file (a worker of import_directory).
+    :param paths: A tuple of the SVG path and the output text path.
+    :return: A tuple of the SVG path and an error message (None on success).
+    """
+    svg_path, txt_path = paths
+    try:
+        rows = svg_to_puzzle(svg_path)
+    except (ValueError, ElementTree.ParseError) as e:
+        return svg_path, str(e)
+    with open(txt_path, 'w') as outfile:
+        outfile.write('\n'.join(rows) + '\n')
+    return svg_path, None
+
+
+def import_directory(svg_dir, out_dir, workers=None):
+    """
+    Converts all the SVG files of a directory to text puzzle files, in parallel.
+    :param svg_dir: The directory of the SVG files.
+    :param out_dir: The directory of the text files (created if needed).
+    :param workers: The number of worker processes (None - the number of CPUs).
+    :return: A list of (SVG path, error message) for the files that couldn't be converted.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(os.path.join(svg_dir, name), os.path.join(out_dir, name[:-len('.svg')] + '.txt'))
+            for name in sorted(os.listdir(svg_dir)) if name.endswith('.svg')]
+    failures = []
+    with Pool(workers) as pool:
+        for svg_path, error in pool.imap_unordered(convert_file, jobs, chunksize=8):
+            if (error is not None):
+                failures.append((svg_path, error))
+    return failures
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Convert SVG renderings of Flow Free puzzles to the text format')
+
+    parser.add_argument('svg_dir', metavar='SVG_DIR', help='directory of the SVG puzzles')
+
+    parser.add_argument('out_dir', metavar='OUT_DIR', help='directory for the text puzzles')
+
+    parser.add_argument('-w', dest='workers', type=int, default=None, help='number of worker processes')
+
+    options = parser.parse_args()
+
+    failures = import_directory(options.svg_dir, options.out_dir, options.workers)
+    for svg_path, error in failures:
+        print('{}: {}'.format(svg_path, error))
+    sys.exit(1 if failures else 0)
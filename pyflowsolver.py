@@ -13,19 +13,16 @@ import os
 import sys
 import operator
 import itertools
-from datetime import datetime
+from datetime import datetime, timedelta
 from argparse import ArgumentParser
 from collections import defaultdict
-import pycosat
 from functools import reduce
-import Agent
 import copy
-import threading
-import ctypes
-import FlowFreeThreads as threads
-import time
-import signal
 import queue
+import random
+
+# pycosat, numpy and the agents machinery are imported lazily by the
+# engine that uses them, so a single-engine run pays only for its own.
 
 
 ########################################################################################################################
@@ -77,7 +74,36 @@ DIR_LOOKUP = {
 
 RESULT_STRINGS = dict(s='successful',
                       f='failed',
-                      u='unsolvable')
+                      u='unsolvable',
+                      t='timeout')
+
+ENGINES = ['sat', 'astar', 'both']
+
+DEFAULT_CACHE_SIZE = 10000
+
+DEFAULT_MAILBOX_SIZE = 1000
+DEFAULT_NOGOOD_SIZE = 0
+
+# the functions of the agents' hot path reported by --profile, besides
+# the most expensive functions overall
+PROFILE_HOT_PATH = r'perform_move|deepcopy|propagate_forced_moves|' \
+                   r'check_for_|detect_|BitsetReachability|Mailbox|OpenList'
+PROFILE_TOP = 20
+
+AMO_ENCODINGS = ['pairwise', 'sequential', 'commander', 'bimander']
+
+# at-most-one constraints over this many variables (or fewer) are
+# always encoded pairwise, the compact encodings pay off only above it
+AMO_PAIRWISE_MAX = 4
+
+COMMANDER_GROUP_SIZE = 3
+
+BIMANDER_GROUP_SIZE = 2
+
+REDUNDANT_FAMILIES = ['uturn', 'corner', 'endpoint', 'link']
+
+# the direction types of a 2x2 block of cells that form a cycle
+UTURN_BLOCK = [((0, 0), BR), ((0, 1), BL), ((1, 0), TR), ((1, 1), TL)]
 
 
 ######################################################################
@@ -102,6 +128,81 @@ that no two of them can be true at the same time.
 
 ######################################################################
 
+class AtMostOne(object):
+
+    '''Generates the clauses specifying that at most one of a collection
+of SAT variables is true, in one of the AMO_ENCODINGS. The pairwise
+encoding (no_two) needs O(k^2) binary clauses for k variables, the
+others need O(k) or O(k log k) clauses by introducing auxiliary
+variables, which are numbered consecutively after start_var.
+
+    '''
+
+    def __init__(self, encoding, start_var):
+        if encoding not in AMO_ENCODINGS:
+            raise ValueError('unknown at-most-one encoding: ' + str(encoding))
+        self.encoding = encoding
+        self.start_var = start_var
+        self.num_aux_vars = 0
+
+    def __call__(self, satvars):
+        satvars = list(satvars)
+        if self.encoding == 'pairwise' or len(satvars) <= AMO_PAIRWISE_MAX:
+            return list(no_two(satvars))
+        return getattr(self, self.encoding)(satvars)
+
+    def new_var(self):
+        '''Allocate a new auxiliary SAT variable.'''
+        self.num_aux_vars += 1
+        return self.start_var + self.num_aux_vars
+
+    def sequential(self, satvars):
+        '''Sequential counter encoding (Sinz 2005): the auxiliary variable
+s_k is set if any of the first k+1 variables is set, 3k-4 clauses and
+k-1 auxiliary variables.'''
+        counters = [self.new_var() for _ in satvars[:-1]]
+        clauses = [(-satvars[0], counters[0])]
+        for k in range(1, len(satvars) - 1):
+            clauses.append((-satvars[k], counters[k]))
+            clauses.append((-counters[k-1], counters[k]))
+            clauses.append((-satvars[k], -counters[k-1]))
+        clauses.append((-satvars[-1], -counters[-1]))
+        return clauses
+
+    def commander(self, satvars):
+        '''Commander encoding (Klieber and Kwon 2007): the variables are
+split into groups, every set variable implies the commander of its
+group, and at most one commander is set (recursively).'''
+        if len(satvars) <= AMO_PAIRWISE_MAX:
+            return list(no_two(satvars))
+        clauses = []
+        commanders = []
+        for g in range(0, len(satvars), COMMANDER_GROUP_SIZE):
+            group = satvars[g:g+COMMANDER_GROUP_SIZE]
+            commander = self.new_var()
+            commanders.append(commander)
+            clauses.extend(no_two(group))
+            clauses.extend((-var, commander) for var in group)
+        clauses.extend(self.commander(commanders))
+        return clauses
+
+    def bimander(self, satvars):
+        '''Bimander encoding (Nguyen and Mai 2015): the variables are
+split into groups, every set variable implies the binary code of its
+group's index over log2(groups) auxiliary bits.'''
+        groups = [satvars[g:g+BIMANDER_GROUP_SIZE] for g in
+                  range(0, len(satvars), BIMANDER_GROUP_SIZE)]
+        bits = [self.new_var() for _ in range((len(groups) - 1).bit_length())]
+        clauses = []
+        for index, group in enumerate(groups):
+            clauses.extend(no_two(group))
+            for var in group:
+                for b, bit in enumerate(bits):
+                    clauses.append((-var, bit if (index >> b) & 1 else -bit))
+        return clauses
+
+######################################################################
+
 def explode(puzzle):
     '''Iterator helper function to allow looping over 2D arrays without
 nested 'for' loops.
@@ -234,11 +335,12 @@ indices.
 
 ######################################################################
 
-def make_color_clauses(puzzle, colors, color_var):
+def make_color_clauses(puzzle, colors, color_var, at_most_one=no_two):
 
     '''Generate CNF clauses entailing the N*M color SAT variables, where N
 is the number of cells and M is the number of colors. Each cell
-encodes a single color in a one-hot fashion.
+encodes a single color in a one-hot fashion, at_most_one generates the
+clauses of the exclusions.
 
     '''
 
@@ -269,7 +371,7 @@ encodes a single color in a one-hot fashion.
             clauses.append(neighbor_vars)
 
             # no two neighbors have this color
-            clauses.extend(no_two(neighbor_vars))
+            clauses.extend(at_most_one(neighbor_vars))
 
         else:
 
@@ -281,7 +383,7 @@ encodes a single color in a one-hot fashion.
             cell_color_vars = (color_var(i, j, color) for
                                color in range(num_colors))
 
-            clauses.extend(no_two(cell_color_vars))
+            clauses.extend(at_most_one(cell_color_vars))
 
     return clauses
 
@@ -321,11 +423,13 @@ def make_dir_vars(puzzle, start_var):
 
 ######################################################################
 
-def make_dir_clauses(puzzle, colors, color_var, dir_vars):
+def make_dir_clauses(puzzle, colors, color_var, dir_vars,
+                     at_most_one=no_two):
 
     '''Generate clauses involving the color and direction-type SAT
 variables. Each free cell must be exactly one direction, and
-directions imply color matching with neighbors.
+directions imply color matching with neighbors. at_most_one generates
+the clauses of the exclusions.
 
     '''
 
@@ -346,7 +450,7 @@ directions imply color matching with neighbors.
         dir_clauses.append(cell_dir_vars)
 
         # no two directions are set in this cell
-        dir_clauses.extend(no_two(cell_dir_vars))
+        dir_clauses.extend(at_most_one(cell_dir_vars))
 
         # for each color
         for color in range(num_colors):
@@ -377,6 +481,144 @@ directions imply color matching with neighbors.
 
 ######################################################################
 
+def links_back(dir_vars, i, j, dir_bit):
+
+    '''Return the direction-type SAT variables of the free cell at row
+i, column j which hit its neighbor in the direction dir_bit.'''
+
+    return [dir_var for dir_type, dir_var in dir_vars[i, j].items()
+            if dir_type & dir_bit]
+
+######################################################################
+
+def make_uturn_clauses(puzzle, dir_vars):
+
+    '''Generate clauses forbidding U-turns: three cells of a 2x2 block
+whose direction types turn around the block force the fourth cell to
+close a cycle of the block (or give a flow endpoint two neighbors of
+its color), so no three of them are set together.
+
+    '''
+
+    clauses = []
+    size = len(puzzle)
+
+    for i, j in itertools.product(range(size-1), range(size-1)):
+        for closing in UTURN_BLOCK:
+            clause = []
+            for (delta_i, delta_j), dir_type in UTURN_BLOCK:
+                if (delta_i, delta_j) == closing[0]:
+                    continue
+                cell_dir_dict = dir_vars.get((i+delta_i, j+delta_j), {})
+                if dir_type not in cell_dir_dict:
+                    break
+                clause.append(-cell_dir_dict[dir_type])
+            else:
+                clauses.append(clause)
+
+    return clauses
+
+######################################################################
+
+def make_corner_clauses(puzzle, dir_vars):
+
+    '''Generate clauses for the free corner cells: a corner cell has a
+single direction type, hitting both of its neighbors, so each free
+neighbor has a direction type hitting the corner back.
+
+    '''
+
+    clauses = []
+    size = len(puzzle)
+
+    for i, j in itertools.product((0, size-1), (0, size-1)):
+        if (i, j) not in dir_vars:
+            continue
+        for dir_bit, n_i, n_j in valid_neighbors(size, i, j):
+            if (n_i, n_j) in dir_vars:
+                clauses.append(links_back(dir_vars, n_i, n_j,
+                                          DIR_FLIP[dir_bit]))
+
+    return clauses
+
+######################################################################
+
+def make_endpoint_clauses(puzzle, colors, color_var, dir_vars):
+
+    '''Generate clauses forcing the free neighbors of a flow endpoint: a
+neighbor with the endpoint's color has a direction type hitting the
+endpoint.
+
+    '''
+
+    clauses = []
+    size = len(puzzle)
+
+    for i, j, char in explode(puzzle):
+        if not char.isalnum():
+            continue
+        for dir_bit, n_i, n_j in valid_neighbors(size, i, j):
+            if (n_i, n_j) in dir_vars:
+                clauses.append([-color_var(n_i, n_j, colors[char])] +
+                               links_back(dir_vars, n_i, n_j,
+                                          DIR_FLIP[dir_bit]))
+
+    return clauses
+
+######################################################################
+
+def make_link_clauses(puzzle, dir_vars):
+
+    '''Generate clauses making the links symmetric: a direction type
+hitting a free neighbor implies that the neighbor has a direction type
+hitting back.
+
+    '''
+
+    clauses = []
+    size = len(puzzle)
+
+    for (i, j), cell_dir_dict in dir_vars.items():
+        for dir_bit, n_i, n_j in valid_neighbors(size, i, j):
+            if (n_i, n_j) not in dir_vars:
+                continue
+            back_vars = links_back(dir_vars, n_i, n_j, DIR_FLIP[dir_bit])
+            for dir_type, dir_var in cell_dir_dict.items():
+                if dir_type & dir_bit:
+                    clauses.append([-dir_var] + back_vars)
+
+    return clauses
+
+######################################################################
+
+def make_redundant_clauses(puzzle, colors, color_var, dir_vars, families):
+
+    '''Generate the selected REDUNDANT_FAMILIES of clauses. They are
+implied by the clauses of make_color_clauses and make_dir_clauses
+together with the absence of cycles, so they keep the set of
+solutions, but let the solver propagate more and find fewer cycles.
+
+    '''
+
+    clauses = []
+
+    if 'uturn' in families:
+        clauses.extend(make_uturn_clauses(puzzle, dir_vars))
+
+    if 'corner' in families:
+        clauses.extend(make_corner_clauses(puzzle, dir_vars))
+
+    if 'endpoint' in families:
+        clauses.extend(make_endpoint_clauses(puzzle, colors, color_var,
+                                             dir_vars))
+
+    if 'link' in families:
+        clauses.extend(make_link_clauses(puzzle, dir_vars))
+
+    return clauses
+
+######################################################################
+
 def reduce_to_sat(options, puzzle, colors):
 
     '''Reduces the given puzzle to a SAT problem specified in CNF. Returns
@@ -386,9 +628,9 @@ possibly negated.
     '''
 
     size = len(list(puzzle))
-    print (isinstance(colors,dict))
     keys = list(colors.keys())
-    print(keys)
+    if not options.quiet:
+        print(keys)
     num_colors = len(keys)
 
     num_cells = size*size
@@ -401,19 +643,32 @@ possibly negated.
         '''
         return (i*size + j)*num_colors + color + 1
 
-    start = datetime.now()
+    import CnfBuffer
 
-    color_clauses = make_color_clauses(puzzle,
-                                       colors,
-                                       color_var)
+    start = datetime.now()
 
     dir_vars, num_dir_vars = make_dir_vars(puzzle, num_color_vars)
 
-    dir_clauses = make_dir_clauses(puzzle, colors,
-                                   color_var, dir_vars)
+    # auxiliary variables of the at-most-one encoding follow the dir variables
+    at_most_one = AtMostOne(options.amo, num_color_vars + num_dir_vars)
+
+    # the same clauses as make_color_clauses and make_dir_clauses,
+    # generated by numpy index arithmetic into flat literal buffers
+    color_clauses = CnfBuffer.make_color_clauses(puzzle,
+                                                 colors,
+                                                 at_most_one)
+
+    dir_clauses = CnfBuffer.make_dir_clauses(puzzle, colors,
+                                             dir_vars,
+                                             at_most_one)
 
-    num_vars = num_color_vars + num_dir_vars
-    clauses = color_clauses + dir_clauses
+    num_vars = num_color_vars + num_dir_vars + at_most_one.num_aux_vars
+    clauses = color_clauses.to_lists() + dir_clauses.to_lists()
+
+    redundant_clauses = make_redundant_clauses(puzzle, colors, color_var,
+                                               dir_vars,
+                                               options.redundant or [])
+    clauses += redundant_clauses
 
     reduce_time = (datetime.now() - start).total_seconds()
 
@@ -422,6 +677,11 @@ possibly negated.
 
         print ('generated {:,} dir clauses over {:,} dir variables'.format(len(dir_clauses), num_dir_vars))
 
+        if redundant_clauses:
+            print ('generated {:,} redundant clauses ({:s})'.format(len(redundant_clauses), ', '.join(options.redundant)))
+
+        print ('{:s} at-most-one encoding with {:,} auxiliary variables'.format(options.amo, at_most_one.num_aux_vars))
+
         print ('total {:,} clauses over {:,} variables'.format(len(clauses), num_vars))
 
         print ('reduced to SAT in {:.3f} seconds'.format(reduce_time))
@@ -435,113 +695,116 @@ def decode_solution(puzzle, colors, color_var, dir_vars, sol):
 
     '''Takes the solution set from SAT and decodes it by undoing the
 one-hot encoding in each cell for color and direction-type. Returns a
-2D array of (color, direction-type) pairs.
+2D array of (color, direction-type) pairs. The model is decoded with
+numpy indexing: the color variables are numbered consecutively by cell
+and color from color_var(0, 0, 0) on (see reduce_to_sat).
 
     '''
 
-    sol = set(sol)
-    num_colors = len(colors)
-
-    decoded = []
+    import numpy as np
 
-    for i, row in enumerate(puzzle):
+    size = len(puzzle)
+    num_colors = len(colors)
+    num_cells = size*size
 
-        decoded_row = []
+    sol = np.asarray(sol)
+    is_true = np.zeros(np.abs(sol).max() + 1, dtype=bool)
+    is_true[sol[sol > 0]] = True
 
-        for j, char in enumerate(row):
+    # exactly one color variable of each cell is in the solution set
+    first_var = color_var(0, 0, 0)
+    color_model = is_true[first_var:first_var + num_cells*num_colors]
+    color_model = color_model.reshape(num_cells, num_colors)
+    assert (color_model.sum(axis=1) == 1).all()
+    cell_colors = color_model.argmax(axis=1)
 
-            # find which color variable for this cell is in the
-            # solution set
-            cell_color = -1
+    # exactly one dir type variable of each free cell is in the solution set
+    cells, dir_types, dir_var_nums = dir_var_arrays(dir_vars, size)
+    true_dirs = is_true[dir_var_nums]
+    cell_dirs = np.full(num_cells, -1)
+    cell_dirs[cells[true_dirs]] = dir_types[true_dirs]
+    assert (np.bincount(cells[true_dirs], minlength=num_cells) ==
+            np.bincount(cells, minlength=num_cells).clip(max=1)).all()
 
-            for color in range(num_colors):
-                if color_var(i, j, color) in sol:
-                    assert cell_color == -1
-                    cell_color = color
+    decoded = np.stack((cell_colors, cell_dirs), axis=-1)
 
-            assert cell_color != -1
+    return [[tuple(cell) for cell in row]
+            for row in decoded.reshape(size, size, 2).tolist()]
 
-            cell_dir_type = -1
+######################################################################
 
-            if not char.isalnum(): # not a flow endpoint
+def dir_var_arrays(dir_vars, size):
 
-                # find which dir type variable for this cell is in the
-                # solution set
-                for dir_type, dir_var in dir_vars[i, j].items():
-                    if dir_var in sol:
-                        assert cell_dir_type == -1
-                        cell_dir_type = dir_type
+    '''Flattens the direction-type SAT variables into numpy arrays: the
+cell index (i*size + j), the dir type and the variable of each.'''
 
-                assert cell_dir_type != -1
+    import numpy as np
 
-            decoded_row.append((cell_color, cell_dir_type))
+    cells, dir_types, dir_var_nums = [], [], []
 
-        decoded.append(decoded_row)
+    for (i, j), cell_dir_dict in dir_vars.items():
+        for dir_type, dir_var in cell_dir_dict.items():
+            cells.append(i*size + j)
+            dir_types.append(dir_type)
+            dir_var_nums.append(dir_var)
 
-    return decoded
+    return (np.array(cells, dtype=int), np.array(dir_types, dtype=int),
+            np.array(dir_var_nums, dtype=int))
 
 ######################################################################
 
-def make_path(decoded, visited, cur_i, cur_j):
+def label_components(num_cells, cells_1, cells_2):
 
-    '''Follow a path starting from an arbitrary row, column location on
-the grid until a non-path cell is detected, or a cycle is
-found. Returns a list of (row, column) pairs on the path, as well as a
-boolean flag indicating if a cycle was detected.
+    '''Connected-component labeling of the graph over num_cells cells
+whose edges are (cells_1[k], cells_2[k]): every round hooks each cell
+to the smallest label among its neighbors and then jumps to the label
+of its label, so a component converges to the label of its smallest
+cell in a logarithmic number of vectorized rounds.
 
     '''
 
-    size = len(decoded)
+    import numpy as np
 
-    run = []
-    is_cycle = False
-    prev_i, prev_j = -1, -1
+    labels = np.arange(num_cells)
 
     while True:
+        hooked = labels.copy()
+        np.minimum.at(hooked, cells_1, labels[cells_2])
+        np.minimum.at(hooked, cells_2, labels[cells_1])
+        hooked = hooked[hooked]
+        if (hooked == labels).all():
+            return labels
+        labels = hooked
 
-        advanced = False
-
-        # get current cell, set visited, add to path
-        color, dir_type = decoded[cur_i][cur_j]
-        visited[cur_i][cur_j] = 1
-        run.append((cur_i, cur_j))
+######################################################################
 
-        # loop over valid neighbors
-        for dir_bit, n_i, n_j in valid_neighbors(size, cur_i, cur_j):
+def follow_cycle(cell_dirs, size, start):
 
-            # do not consider prev pos
-            if (n_i, n_j) == (prev_i, prev_j):
-                continue
+    '''Follow a cycle of free cells from the cell start (a flat index),
+taking at every cell the first neighbor in the order of DELTAS that
+its dir type hits, besides the previous one. Returns the list of flat
+cell indices along the cycle.
 
-            # get neighbor color & dir type
-            n_color, n_dir_type = decoded[n_i][n_j]
+    '''
 
-            # these are connected if one of the two dir type variables
-            # includes the (possibly flipped) direction bit.
-            if ((dir_type >= 0 and (dir_type & dir_bit)) or
-                    (dir_type == -1 and n_dir_type >= 0 and
-                     n_dir_type & DIR_FLIP[dir_bit])):
+    run = []
+    prev = -1
+    cur = start
 
-                # if connected, they better be the same color
-                assert color == n_color
+    while True:
 
-                # detect cycle
-                if visited[n_i][n_j]:
-                    is_cycle = True
-                else:
-                    prev_i, prev_j = cur_i, cur_j
-                    cur_i, cur_j = n_i, n_j
-                    advanced = True
+        run.append(cur)
+        cur_i, cur_j = divmod(cur, size)
 
-                # either cycle detected or path advanced, so stop
-                # looking at neighbors
+        for dir_bit, n_i, n_j in valid_neighbors(size, cur_i, cur_j):
+            neighbor = n_i*size + n_j
+            if neighbor != prev and cell_dirs[cur] & dir_bit:
                 break
 
-        # if path not advanced, quit
-        if not advanced:
-            break
+        if neighbor == start:
+            return run
 
-    return run, is_cycle
+        prev, cur = cur, neighbor
 
 ######################################################################
 
@@ -549,49 +812,53 @@ def detect_cycles(decoded, dir_vars):
 
     '''Examine the decoded SAT solution to see if any cycles exist; if so,
 return the CNF clauses that need to be added to the problem in order
-to prevent them.
+to prevent them. The links between neighbors are arrays, the flows are
+their connected components - the components without flow endpoints
+are the cycles.
 
     '''
 
+    import numpy as np
+
+    decoded = np.asarray(decoded)
     size = len(decoded)
-    colors_seen = set()
-    visited = [[0]*size for _ in range(size)]
 
-    # for each cell
-    for i, j, (color, dir_type) in explode(decoded):
+    cell_colors = decoded[:, :, 0].ravel()
+    cell_dirs = decoded[:, :, 1].ravel()
+    dirs = np.where(cell_dirs >= 0, cell_dirs, 0)
+    index = np.arange(size*size).reshape(size, size)
 
-        # if flow endpoint for color we haven't dealt with yet
-        if dir_type == -1 and color not in colors_seen:
+    # two neighbors are connected if the dir type of one of them hits the other
+    left, right = index[:, :-1].ravel(), index[:, 1:].ravel()
+    top, bottom = index[:-1, :].ravel(), index[1:, :].ravel()
+    h_links = ((dirs[left] & RIGHT) != 0) | ((dirs[right] & LEFT) != 0)
+    v_links = ((dirs[top] & BOTTOM) != 0) | ((dirs[bottom] & TOP) != 0)
+    cells_1 = np.concatenate((left[h_links], top[v_links]))
+    cells_2 = np.concatenate((right[h_links], bottom[v_links]))
 
-            # add it to set of colors dealt with
-            assert not visited[i][j]
-            colors_seen.add(color)
+    # if connected, they better be the same color
+    assert (cell_colors[cells_1] == cell_colors[cells_2]).all()
 
-            # mark the path as visited
-            run, is_cycle = make_path(decoded, visited, i, j)
-            assert not is_cycle
+    labels = label_components(size*size, cells_1, cells_2)
+    on_cycle = ~np.isin(labels, labels[cell_dirs == -1])
 
-    # see if there are any unvisited cells, if so they have cycles
     extra_clauses = []
 
-    for i, j in itertools.product(range(size), range(size)):
-
-        if not visited[i][j]:
+    # every cycle starts from its first cell (its label), as it is
+    # reached by scanning the rows
+    cell_dirs = cell_dirs.tolist()
 
-            # get the path
-            run, is_cycle = make_path(decoded, visited, i, j)
-            assert is_cycle
+    for start in np.unique(labels[on_cycle]).tolist():
 
-            # generate a clause negating the conjunction of all
-            # direction types along the cycle path.
-            clause = []
+        # generate a clause negating the conjunction of all
+        # direction types along the cycle path.
+        clause = []
 
-            for r_i, r_j in run:
-                _, dir_type = decoded[r_i][r_j]
-                dir_var = dir_vars[r_i, r_j][dir_type]
-                clause.append(-dir_var)
+        for cell in follow_cycle(cell_dirs, size, start):
+            r_i, r_j = divmod(cell, size)
+            clause.append(-dir_vars[r_i, r_j][cell_dirs[cell]])
 
-            extra_clauses.append(clause)
+        extra_clauses.append(clause)
 
     # return whatever clauses we had to generate
     return extra_clauses
@@ -654,37 +921,31 @@ CNF.  This is an iterative process: first we try to solve a SAT, then
 we detect cycles. If cycles are found, they are prevented from
 recurring, and the next iteration begins. Returns the SAT solution
 set, the decoded puzzle solution, and the number of cycle repairs
-needed.
+needed. The budgets in the options bound every pycosat call (its
+prop_limit) and the wall-clock time of the whole process; in case that
+one of them is exceeded the solution is the string UNKNOWN.
 
     '''
 
     start = datetime.now()
 
-    decoded = None
-    all_decoded = []
-    repairs = 0
+    sol, decoded, all_decoded, repairs = solve_sat_loop(
+        options, puzzle, colors, color_var, dir_vars, clauses, start)
 
-    while True:
-
-        sol = pycosat.solve(clauses) # pylint: disable=E1101
-
-        if not isinstance(sol, list):
-            decoded = None
-            all_decoded.append(decoded)
-            break
+    solve_time = (datetime.now() - start).total_seconds()
 
-        decoded = decode_solution(puzzle, colors, color_var, dir_vars, sol)
-        all_decoded.append(decoded)
+    show_sat_result(options, colors, sol, decoded, all_decoded, repairs,
+                    solve_time)
 
-        extra_clauses = detect_cycles(decoded, dir_vars)
+    return sol, decoded, repairs, solve_time
 
-        if not extra_clauses:
-            break
+######################################################################
 
-        clauses += extra_clauses
-        repairs += 1
+def show_sat_result(options, colors, sol, decoded, all_decoded, repairs,
+                    solve_time):
 
-    solve_time = (datetime.now() - start).total_seconds()
+    '''Display the result of solve_sat or solve_sat_portfolio (unless in
+quiet mode).'''
 
     if not options.quiet:
         if options.display_cycles:
@@ -707,13 +968,206 @@ needed.
             show_solution(options, colors, decoded)
             print
 
-    return sol, decoded, repairs, solve_time
+######################################################################
+
+def solve_sat_loop(options, puzzle, colors, color_var, dir_vars, clauses,
+                   start, var_map=None):
+
+    '''The iterative process of solve_sat. If var_map is given, the
+clauses are a diversified copy of the CNF whose variable v is numbered
+var_map[v]: the models are mapped back before decoding, and the cycle
+repairs are mapped forward. Returns the SAT solution set, the decoded
+puzzle solution, all the decoded intermediate solutions and the number
+of cycle repairs.
+
+    '''
+
+    import pycosat
+
+    decoded = None
+    all_decoded = []
+    repairs = 0
+
+    prop_limit = options.max_props or 0
+
+    while True:
+
+        sol = pycosat.solve(clauses, prop_limit=prop_limit) # pylint: disable=E1101
+
+        if not isinstance(sol, list):
+            decoded = None
+            all_decoded.append(decoded)
+            break
+
+        if var_map is not None:
+            sol = unmap_solution(sol, var_map)
+
+        decoded = decode_solution(puzzle, colors, color_var, dir_vars, sol)
+        all_decoded.append(decoded)
+
+        extra_clauses = detect_cycles(decoded, dir_vars)
+
+        if not extra_clauses:
+            break
+
+        if var_map is not None:
+            extra_clauses = map_clauses(extra_clauses, var_map)
+
+        clauses += extra_clauses
+        repairs += 1
+
+        if (options.max_time is not None and
+                (datetime.now() - start).total_seconds() > options.max_time):
+            sol = 'UNKNOWN'
+            decoded = None
+            break
+
+    return sol, decoded, all_decoded, repairs
+
+######################################################################
+
+def map_clauses(clauses, var_map):
+
+    '''Renumber the variables of the clauses by var_map.'''
+
+    return [[var_map[lit] if lit > 0 else -var_map[-lit] for lit in clause]
+            for clause in clauses]
+
+######################################################################
+
+def unmap_solution(sol, var_map):
+
+    '''Renumber a SAT solution set of clauses renumbered by var_map back
+to the original variables, in the order of the variables (as pycosat
+returns it).
+
+    '''
+
+    inverse = [0] * len(var_map)
+    for var, mapped_var in enumerate(var_map):
+        inverse[mapped_var] = var
+
+    unmapped = [inverse[lit] if lit > 0 else -inverse[-lit] for lit in sol]
+    unmapped.sort(key=abs)
+
+    return unmapped
+
+######################################################################
+
+def solve_sat_copy(args):
+
+    '''Solve one diversified copy of a portfolio (in a worker process).
+Copy 0 is the CNF of the options; every other copy uses the next
+at-most-one encoding, and its seed shuffles the clauses order, the
+literals order inside the clauses and the variables numbering. Returns
+the copy, the SAT solution set (in the original numbering), the
+decoded puzzle solution, all the decoded intermediate solutions, the
+number of cycle repairs, and the number of variables, the number of
+clauses and the reduction time of the copy.
+
+    '''
+
+    options, puzzle, colors, copy_num = args
+
+    start = datetime.now()
+
+    options = copy.copy(options)
+    options.quiet = True
+    var_map = None
+
+    if copy_num > 0:
+        encoding = AMO_ENCODINGS.index(options.amo) + copy_num
+        options.amo = AMO_ENCODINGS[encoding % len(AMO_ENCODINGS)]
+
+    color_var, dir_vars, num_vars, clauses, reduce_time = \
+        reduce_to_sat(options, puzzle, colors)
+    num_clauses = len(clauses)
+
+    if copy_num > 0:
+        rng = random.Random(copy_num)
+        var_map = list(range(1, num_vars+1))
+        rng.shuffle(var_map)
+        var_map.insert(0, 0)
+        clauses = map_clauses(clauses, var_map)
+        for clause in clauses:
+            rng.shuffle(clause)
+        rng.shuffle(clauses)
+
+    sol, decoded, all_decoded, repairs = solve_sat_loop(
+        options, puzzle, colors, color_var, dir_vars, clauses, start, var_map)
+
+    return (copy_num, sol, decoded, all_decoded, repairs, num_vars,
+            num_clauses, reduce_time)
 
 ######################################################################
 
-def print_summary(options, stats):
+def solve_sat_portfolio(options, puzzle, colors):
+
+    '''Reduce and solve options.portfolio diversified copies of the CNF
+(see solve_sat_copy) in a pool of processes. All the copies have the
+same solutions, so the first one to find a solution (cycle repairs
+included) or to prove unsatisfiability wins, and the pool is
+terminated with the rest. A copy that exceeds a budget returns
+UNKNOWN, which wins only if all of them do. Without a portfolio, the
+CNF of the options is solved by a single copy - a pycosat call can't
+be interrupted, but the process of the copy is terminated when the
+wall-clock budget is exceeded. Returns like solve_sat_copy, without
+the copy: the reduction stats are the winning copy's (zeros if none
+won).
+
+    '''
+
+    import multiprocessing
+
+    start = datetime.now()
+
+    num_copies = max(options.portfolio or 1, 1)
+
+    jobs = [(options, puzzle, colors, copy_num)
+            for copy_num in range(num_copies)]
 
-    '''Print out stats for all solutions.'''
+    result = ('UNKNOWN', None, [None], 0, 0, 0, 0.0)
+
+    with multiprocessing.Pool(num_copies) as pool:
+
+        results = pool.imap_unordered(solve_sat_copy, jobs)
+
+        for _ in jobs:
+
+            timeout = None
+            if options.max_time is not None:
+                timeout = max(0.0, options.max_time -
+                              (datetime.now() - start).total_seconds())
+
+            try:
+                copy_result = results.next(timeout)
+            except multiprocessing.TimeoutError:
+                break
+
+            copy_num, sol, _, _, _, num_vars, num_clauses, _ = copy_result
+
+            if str(sol) != 'UNKNOWN':
+                if not options.quiet and num_copies > 1:
+                    print ('portfolio copy {:d} of {:d} won ({:,} clauses '
+                           'over {:,} variables)'.format(
+                               copy_num, num_copies, num_clauses,
+                               num_vars))
+                elif not options.quiet:
+                    print ('solved {:,} clauses over {:,} variables in a '
+                           'process bounded by --max-time'.format(
+                               num_clauses, num_vars))
+                result = copy_result[1:]
+                break
+
+    return result
+
+######################################################################
+
+def print_summary(options, stats, astar_stats=None):
+
+    '''Print out stats for all solutions: the SAT stats and, if given,
+the multiagent A* stats (the count, the solving time and the expanded
+states per result character).'''
 
     max_width = max(len(f) for f in options.filenames)
 
@@ -725,6 +1179,14 @@ def print_summary(options, stats):
         for k in stats[result_char]:
             all_stats[k] += stats[result_char][k]
 
+    if all_stats['cache_lookups']:
+
+        print ('solution cache: {:d} hits of {:d} lookups ({:.1%}), '\
+            '{:,.3f} sec. of lookups'.format(
+                int(all_stats['cache_hits']), int(all_stats['cache_lookups']),
+                all_stats['cache_hits'] / all_stats['cache_lookups'],
+                all_stats['cache_time']))
+
     if all_stats['count'] > 1:
 
         if not options.quiet:
@@ -738,7 +1200,7 @@ def print_summary(options, stats):
                     '(with {:,d} variables and {:,d} clauses)\n'\
                     '  {:,.3f} sec. to solve (with {:d} repairs)\n'\
                     '  {:,.3f} sec. total\n'.format(
-                        stats[result_char]['count'], result_char,
+                        stats[result_char]['count'], RESULT_STRINGS[result_char],
                         stats[result_char]['reduce_time'],
                         stats[result_char]['num_vars'],
                         stats[result_char]['num_clauses'],
@@ -787,6 +1249,165 @@ def print_summary(options, stats):
                         all_stats['reduce_time'], int(all_stats['repairs']),
                         all_stats['solve_time'], all_stats['total_time']))
 
+    if astar_stats:
+
+        print ('\n'+('*'*70)+'\n')
+
+        for result_char in astar_stats:
+
+            print ('{:d} {:s} multiagent A* searches took:\n'\
+                '  {:,.3f} sec. to solve (with {:,d} expanded states)\n'.format(
+                    astar_stats[result_char]['count'],
+                    RESULT_STRINGS[result_char],
+                    astar_stats[result_char]['solving_time'],
+                    astar_stats[result_char]['total_expanded']))
+
+######################################################################
+
+solution_caches = dict()
+
+def open_solution_cache(options):
+
+    '''Return the SolutionCache of the file given in the options (opened
+once per process), or None if caching is disabled.
+
+    '''
+
+    if options.cache is None:
+        return None
+
+    if options.cache not in solution_caches:
+        import SolutionCache
+        solution_caches[options.cache] = SolutionCache.SolutionCache(
+            options.cache, options.cache_size)
+
+    return solution_caches[options.cache]
+
+######################################################################
+
+def solution_rows(colors, color_of_cell, size):
+
+    '''Convert a solution to the text format of the puzzles, i.e. a list
+of rows where every cell holds the character of its color. The color
+index of a cell is given by the function color_of_cell(i, j).
+
+    '''
+
+    color_chars = dict((color, char) for (char, color) in colors.items())
+
+    return [''.join(color_chars[int(color_of_cell(i, j))] for j in range(size))
+            for i in range(size)]
+
+######################################################################
+
+def lookup_cached_solution(options, puzzle):
+
+    '''Look up the puzzle in the solution cache. Returns the solution
+rows (None on a miss or if caching is disabled) and a dictionary of
+cache stats.
+
+    '''
+
+    cache = open_solution_cache(options)
+
+    if cache is None:
+        return None, dict(cache_lookups=0, cache_hits=0, cache_time=0.0)
+
+    lookup_time = cache.lookup_time
+    rows = cache.lookup(puzzle)
+
+    if rows is not None and not options.quiet:
+        print ('found solution in cache (hit rate {:.1%}):'.format(cache.hit_rate()))
+        for row in rows:
+            print (row)
+
+    return rows, dict(cache_lookups=1,
+                      cache_hits=int(rows is not None),
+                      cache_time=cache.lookup_time - lookup_time)
+
+######################################################################
+
+def store_cached_solution(options, puzzle, rows):
+
+    '''Store a solution in the solution cache (if caching is enabled).'''
+
+    cache = open_solution_cache(options)
+
+    if cache is not None and rows is not None:
+        cache.store(puzzle, rows)
+
+######################################################################
+
+def solve_puzzle_sat(options, puzzle, colors):
+
+    '''Reduce a parsed puzzle to SAT and solve it, unless its solution
+is found in the solution cache. Returns the result character (see
+RESULT_STRINGS), the solution rows (None if there is none) and a
+dictionary of stats for print_summary.
+
+    '''
+
+    rows, cache_stats = lookup_cached_solution(options, puzzle)
+
+    if rows is not None:
+        cur_stats = dict(repairs=0, reduce_time=0.0, solve_time=0.0,
+                         total_time=cache_stats['cache_time'],
+                         num_vars=0, num_clauses=0, count=1)
+        cur_stats.update(cache_stats)
+        return 's', rows, cur_stats
+
+    if ((options.portfolio and options.portfolio > 1) or
+            options.max_time is not None):
+
+        # every copy of the portfolio reduces the puzzle on its own; a
+        # single copy is solved in a process too, so that the wall-clock
+        # budget can stop it in the middle of a pycosat call
+        start = datetime.now()
+
+        sol, decoded, all_decoded, repairs, num_vars, num_clauses, \
+            reduce_time = solve_sat_portfolio(options, puzzle, colors)
+
+        solve_time = (datetime.now() - start).total_seconds() - reduce_time
+
+        show_sat_result(options, colors, sol, decoded, all_decoded, repairs,
+                        solve_time)
+
+    else:
+
+        color_var, dir_vars, num_vars, clauses, reduce_time = \
+            reduce_to_sat(options, puzzle, colors)
+        num_clauses = len(clauses)
+
+        sol, decoded, repairs, solve_time = solve_sat(options, puzzle, colors,
+                                                      color_var, dir_vars,
+                                                      clauses)
+
+    if isinstance(sol, list):
+        result_char = 's'
+    elif str(sol) == 'UNSAT':
+        result_char = 'u'
+    elif str(sol) == 'UNKNOWN':
+        result_char = 't'
+    else:
+        result_char = 'f'
+
+    cur_stats = dict(repairs=repairs,
+                     reduce_time=reduce_time,
+                     solve_time=solve_time,
+                     total_time=reduce_time + solve_time,
+                     num_vars=num_vars,
+                     num_clauses=num_clauses,
+                     count=1)
+    cur_stats.update(cache_stats)
+
+    rows = None
+
+    if decoded is not None:
+        rows = solution_rows(colors, lambda i, j: decoded[i][j][0], len(puzzle))
+        store_cached_solution(options, puzzle, rows)
+
+    return result_char, rows, cur_stats
+
 ######################################################################
 
 def pyflow_solver_main():
@@ -799,7 +1420,7 @@ def pyflow_solver_main():
         description='Solve Flow Free puzzles via reduction to SAT')
 
     parser.add_argument('filenames', metavar='PUZZLE', nargs='+',
-                        help='puzzle file to load')
+                        help='puzzle file to load (text or SVG)')
 
     parser.add_argument('-q', dest='quiet', default=False,
                         action='store_true',
@@ -813,54 +1434,160 @@ def pyflow_solver_main():
                         action='store_true',
                         help='always display color')
 
+    parser.add_argument('--max-time', dest='max_time', type=float,
+                        default=None, metavar='SECONDS',
+                        help='wall-clock budget of every manner')
+
+    parser.add_argument('--max-expanded', dest='max_expanded', type=int,
+                        default=None, metavar='N',
+                        help='budget of expanded states (multiagent A*)')
+
+    parser.add_argument('--max-props', dest='max_props', type=int,
+                        default=None, metavar='N',
+                        help='budget of propagations per SAT call '
+                        '(pycosat prop_limit)')
+
+    parser.add_argument('--max-states', dest='max_states', type=int,
+                        default=None, metavar='N',
+                        help='budget of resident states in the open lists '
+                        'and the bulletin board (multiagent A*)')
+
+    parser.add_argument('--mailbox-size', dest='mailbox_size', type=int,
+                        default=DEFAULT_MAILBOX_SIZE, metavar='N',
+                        help='capacity of every agent\'s mailbox in the '
+                        'bulletin board, 0 for unbounded (multiagent A*)')
+
+    parser.add_argument('--nogoods', dest='nogoods', type=int,
+                        default=DEFAULT_NOGOOD_SIZE, metavar='N',
+                        help='capacity of the store of dead configurations '
+                        'shared by the agents, e.g. 100000 (multiagent A*, '
+                        'default: disabled)')
+
+    parser.add_argument('--profile', dest='profile', default=None,
+                        metavar='PATH',
+                        help='profile every thread that runs agents, merge '
+                        'the profiles into a pstats file (multiagent A*)')
+
+    parser.add_argument('--amo', dest='amo', default='pairwise',
+                        choices=AMO_ENCODINGS,
+                        help='at-most-one encoding of the SAT reduction')
+
+    parser.add_argument('--redundant', dest='redundant', default=None,
+                        action='append', choices=REDUNDANT_FAMILIES,
+                        help='add a family of redundant clauses to the '
+                        'SAT reduction (repeat for several)')
+
+    parser.add_argument('--portfolio', dest='portfolio', type=int,
+                        default=None, metavar='N',
+                        help='solve N diversified copies of the SAT '
+                        'reduction in parallel, the first one wins')
+
+    parser.add_argument('--seed', dest='seed', type=int, default=None,
+                        metavar='N',
+                        help='deterministic multiagent A*: run the agents '
+                        'in a single thread, in an order seeded by N')
+
+    parser.add_argument('--trace', dest='trace', default=None,
+                        metavar='PATH',
+                        help='record the schedule and the bulletin board '
+                        'traffic of a deterministic multiagent A*')
+
+    parser.add_argument('--replay', dest='replay', default=None,
+                        metavar='PATH',
+                        help='replay the schedule of a trace and check that '
+                        'the bulletin board traffic is the same')
+
+    parser.add_argument('--no-steal', dest='no_steal', default=False,
+                        action='store_true',
+                        help='idle agents sleep instead of stealing states '
+                        'from busy agents (multiagent A*)')
+
+    parser.add_argument('--workers', dest='workers', type=int,
+                        default=None, metavar='M',
+                        help='multiplex the agents over M worker threads '
+                        'instead of a thread per agent (multiagent A*)')
+
+    parser.add_argument('--asyncio', dest='use_asyncio', default=False,
+                        action='store_true',
+                        help='run the agents as coroutines of an asyncio '
+                        'event loop in a single thread (multiagent A*)')
+
+    parser.add_argument('--cache', dest='cache', default=None,
+                        metavar='PATH',
+                        help='file of a persistent solution cache')
+
+    parser.add_argument('--cache-size', dest='cache_size', type=int,
+                        default=DEFAULT_CACHE_SIZE,
+                        metavar='N',
+                        help='maximal number of cached solutions')
+
+    parser.add_argument('-e', '--engine', dest='engine', default='both',
+                        choices=ENGINES,
+                        help='manner to solve with: SAT, multiagent A* or '
+                        'both of them (default)')
+
+    parser.add_argument('-B', dest='no_banner', default=False,
+                        action='store_true',
+                        help='do not print the banners')
+
     options = parser.parse_args()
 
+    if not options.no_banner:
+        print("********************************************************************************************************\n")
+        print("*********************************         Free Flow - Solver           *********************************\n")
+        print("********************************************************************************************************\n")
+
+        if options.engine != 'astar':
+            print("\n#############################    Manner 1: Matt Zucker's code for CSP    #############################\n")
+
     max_width = max(len(f) for f in options.filenames)
 
     puzzle_count = 0
 
     stats = dict()
 
+    puzzles = []
+
     for filename in options.filenames:
 
         if not options.quiet and puzzle_count:
             print ('\n'+('*'*70)+'\n')
 
-        # open file
+        # open file (SVG renderings are converted to the text format)
         try:
-            with open(filename, 'r') as infile:
-                puzzle, colors = parse_puzzle(options, infile, filename)
+            if filename.endswith('.svg'):
+                import SvgImporter
+                from xml.etree.ElementTree import ParseError
+                try:
+                    svg_rows = SvgImporter.svg_to_puzzle(filename)
+                except ParseError as e:
+                    print ('{}: {}'.format(filename, e))
+                    continue
+                puzzle, colors = parse_puzzle(
+                    options, '\n'.join(svg_rows), filename)
+            else:
+                with open(filename, 'r') as infile:
+                    puzzle, colors = parse_puzzle(options, infile, filename)
         except IOError:
             print ('{}: error opening file'.format(filename))
             continue
+        except ValueError as e:
+            print ('{}: {}'.format(filename, e))
+            continue
 
         if colors is None:
             continue
 
         puzzle_count += 1
 
-        color_var, dir_vars, num_vars, clauses, reduce_time = \
-            reduce_to_sat(options, puzzle, colors)
-
-        sol, _, repairs, solve_time = solve_sat(options, puzzle, colors,
-                                                color_var, dir_vars, clauses)
+        puzzles.append((puzzle, colors))
 
-        total_time = reduce_time + solve_time
+        if options.engine == 'astar':
+            continue
 
-        if isinstance(sol, list):
-            result_char = 's'
-        elif str(sol) == 'UNSAT':
-            result_char = 'u'
-        else:
-            result_char = 'f'
+        result_char, _, cur_stats = solve_puzzle_sat(options, puzzle, colors)
 
-        cur_stats = dict(repairs=repairs,
-                         reduce_time=reduce_time,
-                         solve_time=solve_time,
-                         total_time=total_time,
-                         num_vars=num_vars,
-                         num_clauses=len(clauses),
-                         count=1)
+        total_time = cur_stats['total_time']
 
         if result_char not in stats:
             stats[result_char] = cur_stats
@@ -875,95 +1602,154 @@ def pyflow_solver_main():
             print ('{:>{}s} {} {:9,d} {:9,d} {:12,.3f} '\
                 '{:3d} {:12,.3f} {:12,.3f}'.format(
                     filename, max_width, result_char,
-                    num_vars, len(clauses), reduce_time,
-                    repairs, solve_time, total_time))
-
-    print_summary(options, stats)
-    ######################################################################
-
-
-    ########################################################################################################################
-    # ---------------------------------------------Multiagent Parallel Distributed A*------------------------------------------------
-    ########################################################################################################################
-
-    global strBoard, colorsAndPlayers
-    strBoard = list(puzzle) # A String representation of the puzzle
-    colorsAndPlayers = dict(colors) # Maps between char representation of players to numerical representation
-
-
-######################################################################
-
-if __name__ == '__main__':
-
-    print("********************************************************************************************************\n")
-    print("*********************************         Free Flow - Solver           *********************************\n")
-    print("********************************************************************************************************\n")
-
-    print("\n#############################    Manner 1: Matt Zucker's code for CSP    #############################\n")
-
-    pyflow_solver_main()
-
-    print("\n\n\n#######################    Manner 2: Multiagent Parallel Distributed A*    #######################\n")
-
-
-    # Creates a State obj. for the correspond puzzle
-    tested_state = Agent.Board.State(len(strBoard), strBoard, colorsAndPlayers)
-
-
-    # Generates the agents
-    global agents
-    for player_num in tested_state.sources:
-        Agent.agents[player_num] = Agent.Agent(player_num, copy.deepcopy(tested_state), tested_state.sources[player_num],
-                                         tested_state.targets[player_num])
-
-    # Creates a Priority-Queue for every agent in the Shared-Resource
-    for agent_num in tested_state.sources:
-        Agent.inter_agents_finished_states[agent_num] = queue.PriorityQueue()
+                    cur_stats['num_vars'], cur_stats['num_clauses'],
+                    cur_stats['reduce_time'], cur_stats['repairs'],
+                    cur_stats['solve_time'], total_time))
 
+    if options.engine == 'sat':
+        print_summary(options, stats)
+        return
 
+    ######################################################################
 
-    print("\n--------------------- Board(State) and Agents were created, now creating Threads ---------------------\n")
+    if not options.no_banner:
+        print("\n\n\n#######################    Manner 2: Multiagent Parallel Distributed A*    #######################\n")
 
-    exceptions_queue = queue.Queue() # A Queue for catching the thrown Exceptions
+    astar_stats = dict()
 
-    # Creating the designated Threads
-    thread_num = 0
-    for agent_index in Agent.agents:
-        threads.threads[thread_num] = threads.FlowFreeThread(thread_num, Agent.agents[agent_index], exceptions_queue)
-        thread_num += 1
+    for puzzle, colors in puzzles:
+        result = multiagent_astar_main(options, puzzle, colors)
+        cur_stats = astar_stats.setdefault(result['result_char'], dict(
+            count=0, solving_time=0.0, total_expanded=0))
+        cur_stats['count'] += 1
+        cur_stats['solving_time'] += result['solving_time']
+        cur_stats['total_expanded'] += result['total_expanded']
 
+    print_summary(options, stats, astar_stats)
 
-    threads.run_threads()# Start running the designated Threads
 
-    ending_manner2_time = None
-    beginning_manner2_time = datetime.now()
+######################################################################
 
-    # Waiting for an Exception to be thrown - i.e that an agent will find the Total Solution
-    while True:
-        try:
-            exception = exceptions_queue.get()
-        except exceptions_queue.Empty:
-            pass
-        else:
-            ending_manner2_time = datetime.now()
-            print(exception)
-            break
+########################################################################################################################
+# ---------------------------------------------Multiagent Parallel Distributed A*------------------------------------------------
+########################################################################################################################
 
+def print_profile_summary(path, stats, missing):
+    """
+    Saves the merged profile of the agents' Threads and prints the most expensive functions and the hot path functions
+    (see PROFILE_HOT_PATH). Warns in case that the profile is missing or partial.
+    :param path: The path of the pstats file (can be read by pstats, snakeviz, gprof2dot etc.).
+    :param stats: The pstats.Stats of the solving (None - no Thread was profiled).
+    :param missing: The number of the Threads whose profiles are missing since they are still running.
+    """
+    if (missing):
+        print("\n\n Warning: the profiles of " + str(missing) + " Threads that are still running are missing \n")
+    if (stats is None):
+        print("\n\n Warning: no profile was collected, " + path + " wasn't saved \n")
+        return
+    stats.dump_stats(path)
+    print("\n\n ---------------------- Profile of the agents (saved to " + path + "): ---------------------- \n")
+    stats.sort_stats('tottime').print_stats(PROFILE_TOP)
+    print(" ---------------------- Hot path: ---------------------- \n")
+    stats.sort_stats('cumulative').print_stats(PROFILE_HOT_PATH)
+
+
+def multiagent_astar_main(options, puzzle, colors):
+    """
+    Solves a parsed puzzle by the Multiagent Parallel Distributed A*: creates an agent and a designated Thread for every
+    color and waits (in the calling Thread) until a Global Goal-State was found, the search space was exhausted or a
+    budget was exceeded. Every call solves in its own Solver session, so calls from concurrent Threads don't interfere.
+    :param options: The parsed options (contain the budgets).
+    :param puzzle: A String representation of the puzzle (a list of rows).
+    :param colors: Maps between char representation of players to numerical representation.
+    :return: A dictionary contains the result char (see RESULT_STRINGS), the Global Goal-State (None if there isn't or
+    if the solution was found in the solution cache), the best partial State on a timeout, the solution rows, the
+    solving time (seconds), the expanded States per agent and in total, the cache stats and the mailbox stats.
+    """
+    import Solver
+    import Scheduler
+
+    # A deterministic solving (reproducible node counts) - by a seeded schedule or by the schedule of a trace
+    scheduler = None
+    if (options.replay is not None):
+        scheduler = Scheduler.DeterministicScheduler.load(options.replay)
+    elif (options.seed is not None or options.trace is not None):
+        scheduler = Scheduler.DeterministicScheduler(options.seed or 0)
+
+    # A solution of this puzzle (or of a rotated/reflected/relabeled one) was already found. A deterministic solving
+    # always searches, since it is made for comparing the searches.
+    cache_stats = {}
+    if (scheduler is None):
+        rows, cache_stats = lookup_cached_solution(options, puzzle)
+        if (rows is not None):
+            return dict(result_char='s', goal_state=None, best_partial_state=None, solution=rows,
+                        solving_time=cache_stats['cache_time'], expanded_states={}, total_expanded=0,
+                        cache_stats=cache_stats, mailbox_stats={}, nogood_stats={})
+
+    # A fresh session - owns the agents, the Shared-Resource and the Threads of this solving
+    session = Solver.Solver(options.max_time, options.max_expanded, options.max_states,
+                            work_stealing=not options.no_steal,
+                            mailbox_capacity=options.mailbox_size or None,
+                            scheduler=scheduler, workers=options.workers,
+                            use_asyncio=options.use_asyncio,
+                            nogood_capacity=options.nogoods,
+                            profile=options.profile is not None)
+
+    print("\n--------------------- Creating the Board(State), the Agents and their Threads ---------------------\n")
 
-    threads.terminate_threads() # Asking the running the Threads to terminate
+    try:
+        result = session.solve(puzzle, colors)
+    except Scheduler.ReplayDivergence as e:
+        print("\n\n ---------------------- REPLAY DIVERGED: " + str(e) + " ---------------------- \n")
+        return dict(result_char='f', goal_state=None, best_partial_state=None, solution=None,
+                    cache_stats=cache_stats, solving_time=0.0, expanded_states={}, total_expanded=0,
+                    mailbox_stats={}, nogood_stats={})
+    if (options.trace is not None):
+        scheduler.save(options.trace)
+    if (options.profile is not None):
+        print_profile_summary(options.profile, *session.get_profile_stats())
 
     print("\n\n Solving Time Format- H:MM:SS.  \n")
-    print(" Solving Time:        " + str(ending_manner2_time - beginning_manner2_time) + " \n")
-
-
-    total_expanded_nodes = Agent.get_total_expanded_nodes()
-    print("\n\n Total expanded nodes: " + str(total_expanded_nodes) + " \n")
-
-
-
-    print("\n\n ---------------------- Reach the follow Goal-State: ---------------------- \n")
-
-    Agent.Board.goal_state.print_board() #Displays the Global Goal-State
+    print(" Solving Time:        " + str(timedelta(seconds=result.solving_time)) + " \n")
+
+    for agent_num in result.expanded_states:
+        print("Agent " + str(agent_num) + " Expanded " + str(result.expanded_states[agent_num]) + " nodes")
+    print("\n\n Total expanded nodes: " + str(result.total_expanded) + " \n")
+    print(" Mailboxes: " + str(result.mailbox_stats['mailbox_evicted']) + " states evicted (full), " +
+          str(result.mailbox_stats['mailbox_superseded']) + " states superseded \n")
+    if (result.nogood_stats):
+        print(" Nogoods: " + str(result.nogood_stats['nogood_added']) + " dead configurations stored, " +
+              str(result.nogood_stats['nogood_hits']) + " states rejected by a lookup, " +
+              str(result.nogood_stats['nogood_evicted']) + " evicted \n")
+
+    if (result.result_char == 't'): # Stopped by a budget - displays the best partial State
+        print("\n\n ---------------------- TIMEOUT: a budget was exceeded, best partial State: ---------------------- \n")
+        if (result.best_partial_state is not None):
+            result.best_partial_state.print_board()
+    elif (result.result_char == 'u'): # All the agents became idle without reaching a Global Goal-State
+        print("\n\n ---------------------- UNSOLVABLE: the search space was exhausted ---------------------- \n")
+    else:
+        print("\n\n ---------------------- Reach the follow Goal-State: ---------------------- \n")
+        result.goal_state.print_board() #Displays the Global Goal-State
+
+    rows = None
+    if (result.goal_state is not None):
+        rows = solution_rows(colors, lambda row, col: result.goal_state.board[row][col], len(puzzle))
+        store_cached_solution(options, puzzle, rows)
+
+    return dict(result_char=result.result_char,
+                goal_state=result.goal_state,
+                best_partial_state=result.best_partial_state,
+                solution=rows,
+                cache_stats=cache_stats,
+                solving_time=result.solving_time,
+                expanded_states=result.expanded_states,
+                total_expanded=result.total_expanded,
+                mailbox_stats=result.mailbox_stats,
+                nogood_stats=result.nogood_stats)
 
+######################################################################
 
+if __name__ == '__main__':
 
+    pyflow_solver_main()